@@ -0,0 +1,149 @@
+"""
+Time fetching a calendar view page by page from a stand-in server that
+answers each page after a fixed latency, with and without prefetching the
+next page.
+
+    python benchmarks/paging.py [--events 1000] [--latency 0.05] [--work 0.04]
+
+`--work` adds simulated processing time per page on top of converting the
+events, standing in for whatever the caller does with each page.
+
+The `Calendar` is built offline from a replay cassette, and its view request
+pointed at the stand-in server, so the real `iter_pages`, `get_page` and
+`extract_fields` are timed.
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from requests.adapters import HTTPAdapter
+
+import thallo.cassette
+
+from thallo.calendar import Calendar
+
+ORIGIN = datetime(2026, 1, 5, 8, tzinfo=timezone.utc)
+
+
+def raw_event(i: int) -> dict:
+    start = ORIGIN + timedelta(minutes=30 * i)
+    end = start + timedelta(minutes=30)
+    return {
+        "id": f"e{i}",
+        "subject": f"Event {i}",
+        "body": {"contentType": "html", "content": f"<p>Agenda for <b>{i}</b></p>"},
+        "start": {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%S"), "timeZone": "UTC"},
+        "end": {"dateTime": end.strftime("%Y-%m-%dT%H:%M:%S"), "timeZone": "UTC"},
+        "attendees": [
+            {"emailAddress": {"name": f"Person {i % 7}", "address": f"p{i % 7}@x.com"}}
+        ],
+    }
+
+
+def stand_in_server(n_events: int, latency: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlsplit(self.path).query)
+            top = int(query["$top"][0])
+            skip = int(query.get("$skip", ["0"])[0])
+            time.sleep(latency)
+
+            page = {
+                "value": [raw_event(i) for i in range(skip, min(skip + top, n_events))]
+            }
+            if skip + top < n_events:
+                host, port = self.server.server_address
+                next_query = urlencode({"$top": top, "$skip": skip + top})
+                page["@odata.nextLink"] = f"http://{host}:{port}/view?{next_query}"
+
+            body = json.dumps(page).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def offline_calendar(server: ThreadingHTTPServer) -> Calendar:
+    # a cassette answering the one request made when the calendar is built
+    path = tempfile.mkdtemp()
+    recorder = thallo.cassette.Cassette(path, mode="record")
+    recorder.record(
+        "GET",
+        "https://graph.microsoft.com/v1.0/me/calendar",
+        {},
+        None,
+        200,
+        "OK",
+        {"Content-Type": "application/json"},
+        json.dumps({"id": "calendar"}).encode(),
+    )
+    thallo.cassette.use(thallo.cassette.Cassette(path, mode="replay"))
+    calendar = Calendar(root_dir=tempfile.mkdtemp())
+    thallo.cassette.use(None)
+
+    # the stand-in server is plain http, which the oauth session refuses
+    os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+    calendar.account.con.session.mount("http://", HTTPAdapter())
+    host, port = server.server_address
+
+    def view_request(start, end, page_size=None):
+        return f"http://{host}:{port}/view", {"$top": page_size}
+
+    calendar.view_request = view_request
+    return calendar
+
+
+def run(calendar: Calendar, n_events: int, page_size: int, prefetch: int, work=0.0):
+    t = time.perf_counter()
+    n = 0
+    for page in calendar.iter_pages(None, None, page_size=page_size, prefetch=prefetch):
+        n += len([Calendar.extract_fields(e) for e in page])
+        time.sleep(work)
+    elapsed = time.perf_counter() - t
+    assert n == n_events, n
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--work", type=float, default=0.04)
+    parser.add_argument("--page-sizes", default="25,100,500")
+    args = parser.parse_args()
+
+    server = stand_in_server(args.events, args.latency)
+    calendar = offline_calendar(server)
+
+    print(
+        f"{args.events} events, {args.latency * 1000:.0f} ms latency and "
+        f"{args.work * 1000:.0f} ms of work per page"
+    )
+    print(f"{'page size':>10} {'pages':>6} {'no prefetch':>12} {'prefetch':>10}")
+    for page_size in (int(p) for p in args.page_sizes.split(",")):
+        pages = -(-args.events // page_size)
+        plain = run(calendar, args.events, page_size, 0, args.work)
+        ahead = run(calendar, args.events, page_size, 1, args.work)
+        print(f"{page_size:>10} {pages:>6} {plain:>11.2f}s {ahead:>9.2f}s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Time rendering an agenda of synthetic events, as `thallo fetch` prints it.
+
+    python benchmarks/render.py [--events 10000] [--repeat 5]
+
+Output goes to an in-memory buffer, so the terminal and pager are left out.
+"""
+
+import io
+import time
+import random
+import argparse
+
+from datetime import datetime, timedelta, timezone
+
+from thallo.format import pretty_print_events
+
+WORDS = "agenda review notes action items follow up design sync budget plan".split()
+
+
+def synthetic_events(n: int, seed=0) -> list[dict]:
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 5, 8, tzinfo=timezone.utc)
+    people = [
+        {"name": f"Person {i}", "address": f"person{i}@example.com"} for i in range(200)
+    ]
+    events = []
+    for i in range(n):
+        t = start + timedelta(minutes=30 * i)
+        events.append(
+            {
+                "name": " ".join(rng.choices(WORDS, k=3)).title(),
+                "body": " ".join(rng.choices(WORDS, k=rng.randint(0, 80))),
+                "attendees": rng.sample(people, rng.randint(0, 8)),
+                "organizer": rng.choice(people),
+                "location": {"displayName": f"Room {i % 20}", "uniqueId": f"r{i % 20}"},
+                "start_time": t,
+                "end_time": t + timedelta(minutes=30),
+            }
+        )
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    events = synthetic_events(args.events)
+    times = []
+    for _ in range(args.repeat):
+        buf = io.StringIO()
+        t = time.perf_counter()
+        pretty_print_events(events, header="Events", file=buf)
+        times.append(time.perf_counter() - t)
+
+    print(
+        f"{args.events} events: best {min(times) * 1000:.0f} ms, "
+        f"median {sorted(times)[len(times) // 2] * 1000:.0f} ms, "
+        f"{len(buf.getvalue()) // 1024} KiB of output"
+    )
+
+
+if __name__ == "__main__":
+    main()
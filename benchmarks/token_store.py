@@ -0,0 +1,70 @@
+"""
+Time loading a token file through each token store.
+
+    python benchmarks/token_store.py [--loads 50] [--recipient you@example.com]
+
+The `aead` store is timed with its key already found (the steady state) and
+with the key looked up from `THALLO_TOKEN_KEY` on first use. The `gpg` store
+is only timed with `--recipient`, and needs a gpg agent that can decrypt to
+that recipient without prompting.
+"""
+
+import os
+import time
+import pathlib
+import argparse
+import tempfile
+
+from thallo.store import AeadStore, GpgStore, KEY_ENV, encode_key, generate_key
+
+
+def synthetic_token() -> dict:
+    # about the size of a real token file
+    return {
+        "client_id": "0" * 36,
+        "client_secret": "s" * 40,
+        "access_token": "a" * 1800,
+        "refresh_token": "r" * 600,
+        "token_type": "Bearer",
+        "expires_at": 2**31,
+    }
+
+
+def per_load(make_store, path: pathlib.Path, loads: int) -> float:
+    """The mean time of a load in milliseconds, from the store `make_store` gives."""
+    t = time.perf_counter()
+    for _ in range(loads):
+        make_store().load(path)
+    return (time.perf_counter() - t) / loads * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--loads", type=int, default=50)
+    parser.add_argument("--recipient", help="A gpg recipient, to time gpg too.")
+    args = parser.parse_args()
+
+    directory = pathlib.Path(tempfile.mkdtemp())
+    token = synthetic_token()
+
+    key = generate_key()
+    aead_path = directory / "TOKEN.aead"
+    warm = AeadStore(key=key)
+    warm.save(aead_path, token)
+    found = per_load(lambda: warm, aead_path, args.loads)
+    print(f"aead, key found:     {found:8.3f} ms")
+
+    os.environ[KEY_ENV] = encode_key(key)
+    cold = per_load(AeadStore, aead_path, args.loads)
+    print(f"aead, key from env:  {cold:8.3f} ms")
+
+    if args.recipient:
+        gpg_path = directory / "TOKEN.gpg"
+        store = GpgStore(recipient=args.recipient)
+        store.save(gpg_path, token)
+        gpg = per_load(lambda: store, gpg_path, args.loads)
+        print(f"gpg:                 {gpg:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+import thallo.cassette
+
+from thallo.calendar import Calendar
+
+GRAPH = "https://graph.microsoft.com/v1.0"
+
+
+@pytest.fixture
+def replay_calendar(tmp_path):
+    """
+    Make a `Calendar` that replays a cassette of GET requests, given as
+    responses by URL, with no network or token.
+    """
+
+    def make(responses=None) -> Calendar:
+        responses = dict(responses or {})
+        responses.setdefault(f"{GRAPH}/me/calendar", {"id": "cal"})
+
+        path = tmp_path / "cassette"
+        recorder = thallo.cassette.Cassette(path, mode="record")
+        for url, body in responses.items():
+            recorder.record(
+                "GET",
+                url,
+                {},
+                None,
+                200,
+                "OK",
+                {"Content-Type": "application/json"},
+                json.dumps(body).encode(),
+            )
+
+        thallo.cassette.use(thallo.cassette.Cassette(path, mode="replay"))
+        try:
+            return Calendar(root_dir=tmp_path / "root")
+        finally:
+            thallo.cassette.use(None)
+
+    return make
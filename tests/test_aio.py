@@ -0,0 +1,81 @@
+import time
+import asyncio
+import contextlib
+import threading
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from thallo.aio import AsyncCalendar
+
+START = datetime(2026, 10, 19, tzinfo=timezone.utc)
+PAGES = 3
+
+
+class SlowPages:
+    """Stands in for `Calendar.get_page`, counting the requests in flight."""
+
+    def __init__(self, calendar, delay=0.05):
+        self.calendar = calendar
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.most = 0
+
+    def __call__(self, url, params=None):
+        with self.lock:
+            self.in_flight += 1
+            self.most = max(self.most, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+
+        page = int(url.rsplit("=", 1)[1]) if "page=" in url else 0
+        start = START + timedelta(days=page)
+        event = {
+            "id": f"e{page}",
+            "subject": f"Event {page}",
+            "body": {"contentType": "text", "content": ""},
+            "start": {"dateTime": f"{start:%Y-%m-%dT09:00:00}", "timeZone": "UTC"},
+            "end": {"dateTime": f"{start:%Y-%m-%dT10:00:00}", "timeZone": "UTC"},
+        }
+        next_link = f"https://next?page={page + 1}" if page + 1 < PAGES else None
+        return [self.calendar.to_event(event)], next_link
+
+
+@pytest.fixture
+def pages(replay_calendar):
+    calendar = replay_calendar()
+    calendar.get_page = SlowPages(calendar)
+    return calendar.get_page
+
+
+def test_limit_bounds_requests(pages):
+    async def main():
+        async with AsyncCalendar(pages.calendar, max_concurrency=2) as ac:
+            end = START + timedelta(days=PAGES)
+            results = await asyncio.gather(
+                *(ac.fetch_dict(START, end) for _ in range(3)),
+                *(ac.fetch(START, end) for _ in range(3)),
+            )
+        return results
+
+    results = asyncio.run(main())
+    assert [len(r) for r in results] == [PAGES] * 6
+    assert pages.most == 2
+
+
+def test_closing_stream_releases_limit(pages):
+    async def main():
+        async with AsyncCalendar(pages.calendar, max_concurrency=2) as ac:
+            end = START + timedelta(days=PAGES)
+            async with contextlib.aclosing(ac.stream(START, end)) as stream:
+                async for event in stream:
+                    assert event["name"] == "Event 0"
+                    break
+            # the prefetched page was cancelled, and its permit returned
+            await asyncio.sleep(0)
+            return ac._limit._value
+
+    assert asyncio.run(main()) == 2
@@ -0,0 +1,47 @@
+import time
+
+from datetime import datetime, timezone
+
+from thallo.calendar import Calendar
+from thallo.directory import Directory
+
+NOW = time.time()
+PEOPLE = [
+    ("ada.lovelace@example.com", "Ada Lovelace", 12, NOW),
+    ("alan.turing@example.com", "Alan Turing", 3, NOW),
+]
+
+
+def test_resolve_keeps_name():
+    directory = Directory(PEOPLE, now=NOW)
+    assert directory.resolve("lovel") == (
+        {"name": "Ada Lovelace", "address": "ada.lovelace@example.com"},
+        None,
+    )
+    assert directory.resolve("Alan.Turing@example.com") == (
+        {"name": "Alan Turing", "address": "Alan.Turing@example.com"},
+        None,
+    )
+
+
+def test_resolve_warns_without_name():
+    directory = Directory(PEOPLE, now=NOW)
+    person, warning = directory.resolve("ada.lovelace@exmaple.com")
+    assert person == {"name": None, "address": "ada.lovelace@exmaple.com"}
+    assert "did you mean ada.lovelace@example.com" in warning
+
+    person, warning = directory.resolve("grace")
+    assert person["name"] is None and warning
+
+
+def test_invitations_carry_names():
+    person, _ = Directory(PEOPLE, now=NOW).resolve("ada")
+    ev = Calendar.draft_event(
+        datetime(2026, 10, 20, 9, tzinfo=timezone.utc),
+        datetime(2026, 10, 20, 10, tzinfo=timezone.utc),
+        attendees=[person, "bob@example.com"],
+    )
+    assert [a["emailAddress"] for a in ev.to_api_data()["attendees"]] == [
+        {"address": "ada.lovelace@example.com", "name": "Ada Lovelace"},
+        {"address": "bob@example.com", "name": None},
+    ]
@@ -0,0 +1,156 @@
+import time
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import thallo.fresh as fresh
+
+from thallo.index import EventIndex
+
+START = datetime(2026, 10, 19, tzinfo=timezone.utc)
+DAY = timedelta(days=1)
+
+
+def event(name: str, day: int) -> dict:
+    start = START + day * DAY + timedelta(hours=9)
+    return {
+        "name": name,
+        "body": "",
+        "attendees": [],
+        "organizer": None,
+        "location": {},
+        "start_time": start,
+        "end_time": start + timedelta(hours=1),
+    }
+
+
+class FakeClient:
+    """Fetches `events`, updating the index as `Calendar.fetch_dict` does."""
+
+    def __init__(self, index, events):
+        self.index = index
+        self.events = events
+        self.fetches = 0
+        self.error = None
+
+    def fetch(self, start, end, **_):
+        self.fetches += 1
+        if self.error is not None:
+            raise self.error
+        self.index.update(start, end, [(e["name"], e) for e in self.events])
+        return self.events
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = EventIndex(tmp_path / "index.db")
+    yield index
+    index.close()
+
+
+def fetched(index, start, end, ago):
+    """Mark a range as fetched `ago` seconds ago."""
+    with index.lock, index.db:
+        index._record_range(start.timestamp(), end.timestamp(), time.time() - ago)
+
+
+def ranges(index) -> list[tuple]:
+    rows = index.db.execute("SELECT start, end FROM ranges ORDER BY start")
+    return [
+        (int((s - START.timestamp()) / 86400), int((e - START.timestamp()) / 86400))
+        for s, e in rows
+    ]
+
+
+def test_age_of_unfetched_range(index):
+    assert index.age(START, START + DAY) is None
+    fetched(index, START, START + DAY, 60)
+    assert index.age(START, START + 2 * DAY) is None
+    assert index.age(START, START + DAY) == pytest.approx(60, abs=1)
+
+
+def test_overlapping_refresh_trims_older_range(index):
+    fetched(index, START, START + 10 * DAY, 600)
+    fetched(index, START + 5 * DAY, START + 15 * DAY, 60)
+    assert ranges(index) == [(0, 5), (5, 15)]
+    # the oldest part of a range counts
+    assert index.age(START, START + 15 * DAY) == pytest.approx(600, abs=1)
+    assert index.age(START + 5 * DAY, START + 15 * DAY) == pytest.approx(60, abs=1)
+
+
+def test_refresh_inside_older_range_splits_it(index):
+    fetched(index, START, START + 10 * DAY, 600)
+    fetched(index, START + 3 * DAY, START + 4 * DAY, 60)
+    assert ranges(index) == [(0, 3), (3, 4), (4, 10)]
+    assert index.age(START + 3 * DAY, START + 4 * DAY) == pytest.approx(60, abs=1)
+    assert index.age(START + 2 * DAY, START + 4 * DAY) == pytest.approx(600, abs=1)
+
+
+def test_lookup_states(index):
+    end = START + 2 * DAY
+    assert fresh.lookup(index, START, end, 60, 60)[0] == fresh.EXPIRED
+
+    index.update(START, end, [("a", event("a", 0))])
+    state, age, events = fresh.lookup(index, START, end, 60, 60)
+    assert state == fresh.FRESH
+    assert [e["name"] for e in events] == ["a"]
+
+    fetched(index, START, end, 90)
+    assert fresh.lookup(index, START, end, 60, 60)[0] == fresh.STALE
+    fetched(index, START, end, 150)
+    assert fresh.lookup(index, START, end, 60, 60)[:2] == (
+        fresh.EXPIRED,
+        pytest.approx(150, abs=1),
+    )
+
+
+def test_fetch_fresh_and_expired(index):
+    end = START + 2 * DAY
+    client = FakeClient(index, [event("a", 0)])
+
+    events, age, thread = fresh.fetch(client, START, end, max_age=60)
+    assert (client.fetches, age, thread) == (1, None, None)
+
+    events, age, thread = fresh.fetch(client, START, end, max_age=60)
+    assert client.fetches == 1 and thread is None
+    assert [e["name"] for e in events] == ["a"]
+
+
+def test_fetch_stale_revalidates(index):
+    end = START + 2 * DAY
+    index.update(START, end, [("a", event("a", 0))])
+    fetched(index, START, end, 90)
+    client = FakeClient(index, [event("a", 0), event("b", 1)])
+
+    changes = []
+    events, age, thread = fresh.fetch(
+        client,
+        START,
+        end,
+        max_age=60,
+        stale=60,
+        on_change=lambda added, removed, _: changes.append((added, removed)),
+    )
+    assert [e["name"] for e in events] == ["a"]
+    assert age == pytest.approx(90, abs=1)
+    thread.join()
+    assert changes == [(1, 0)]
+    assert index.age(START, end) < 5
+
+
+def test_failed_revalidation_keeps_index(index):
+    end = START + 2 * DAY
+    index.update(START, end, [("a", event("a", 0))])
+    fetched(index, START, end, 90)
+    client = FakeClient(index, [])
+    client.error = ConnectionError("offline")
+
+    errors = []
+    events, _, thread = fresh.fetch(
+        client, START, end, max_age=60, stale=60, on_error=errors.append
+    )
+    thread.join()
+    assert [str(e) for e in errors] == ["offline"]
+    assert [e["name"] for e in index.events_between(START, end)] == ["a"]
+    assert index.age(START, end) == pytest.approx(90, abs=1)
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, timezone
+
+from thallo.index import EventIndex
+
+DAY1 = datetime(2026, 10, 19, tzinfo=timezone.utc)
+DAY2 = DAY1 + timedelta(days=1)
+DAY3 = DAY2 + timedelta(days=1)
+
+
+def event(name: str, start: datetime, hours: float) -> dict:
+    return {
+        "name": name,
+        "body": "",
+        "attendees": [],
+        "organizer": None,
+        "location": {},
+        "start_time": start,
+        "end_time": start + timedelta(hours=hours),
+    }
+
+
+def test_events_between_overlapping(tmp_path):
+    index = EventIndex(tmp_path / "index.db")
+    late = event("late", DAY2 - timedelta(hours=1), 2)
+    ends_at_midnight = event("ends", DAY2 - timedelta(hours=1), 1)
+    starts_at_midnight = event("starts", DAY2, 1)
+    index.update(
+        DAY1,
+        DAY3,
+        [(e["name"], e) for e in (late, ends_at_midnight, starts_at_midnight)],
+    )
+
+    def names(start, end):
+        return {e["name"] for e in index.events_between(start, end)}
+
+    # an event crossing the boundary is in both days, like calendarView
+    assert names(DAY1, DAY2) == {"ends", "late"}
+    assert names(DAY2, DAY3) == {"late", "starts"}
+    index.close()
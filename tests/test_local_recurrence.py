@@ -0,0 +1,167 @@
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+GRAPH = "https://graph.microsoft.com/v1.0"
+
+START = datetime(2026, 10, 20, tzinfo=timezone.utc)
+END = datetime(2026, 10, 25, tzinfo=timezone.utc)
+
+
+def graph_time(value: str) -> dict:
+    return {"dateTime": value, "timeZone": "UTC"}
+
+
+def event(id, subject, start, end, **fields) -> dict:
+    return dict(
+        id=id,
+        subject=subject,
+        body={"contentType": "text", "content": f"About {subject}"},
+        start=graph_time(start),
+        end=graph_time(end),
+        **fields,
+    )
+
+
+SINGLE = event("s", "Review", "2026-10-20T10:00:00", "2026-10-20T11:00:00")
+
+# a daily standup, with the 21st cancelled and the 22nd moved an hour later
+DAILY = event(
+    "D",
+    "Standup",
+    "2026-10-19T08:00:00",
+    "2026-10-19T08:15:00",
+    type="seriesMaster",
+    changeKey="d1",
+    recurrence={
+        "pattern": {"type": "daily", "interval": 1},
+        "range": {
+            "type": "noEnd",
+            "startDate": "2026-10-19",
+            "recurrenceTimeZone": "UTC",
+        },
+    },
+)
+DAILY_MOVED = event(
+    "D22",
+    "Standup",
+    "2026-10-22T09:00:00",
+    "2026-10-22T09:15:00",
+    type="exception",
+    seriesMasterId="D",
+)
+
+# a Monday meeting, none of which fall in the window, but with the
+# occurrence of the 26th moved into it
+WEEKLY = event(
+    "W",
+    "Planning",
+    "2026-09-07T14:00:00",
+    "2026-09-07T15:00:00",
+    type="seriesMaster",
+    changeKey="w1",
+    recurrence={
+        "pattern": {"type": "weekly", "interval": 1, "daysOfWeek": ["monday"]},
+        "range": {
+            "type": "noEnd",
+            "startDate": "2026-09-07",
+            "recurrenceTimeZone": "UTC",
+        },
+    },
+)
+WEEKLY_MOVED = event(
+    "W26",
+    "Planning (moved)",
+    "2026-10-22T15:00:00",
+    "2026-10-22T16:00:00",
+    type="exception",
+    seriesMasterId="W",
+)
+
+
+def occurrence(master: dict, day: int) -> dict:
+    start = master["start"]["dateTime"][11:]
+    end = master["end"]["dateTime"][11:]
+    return dict(
+        master,
+        id=f"{master['id']}{day}",
+        type="occurrence",
+        seriesMasterId=master["id"],
+        start=graph_time(f"2026-10-{day}T{start}"),
+        end=graph_time(f"2026-10-{day}T{end}"),
+    )
+
+
+def url(path: str, **params) -> str:
+    return f"{GRAPH}/me{path}?{urlencode(params)}"
+
+
+def instances(*items) -> dict:
+    return {
+        "value": [
+            {"id": i, "type": t, "originalStart": f"{start}Z"} for i, t, start in items
+        ]
+    }
+
+
+def responses() -> dict:
+    """The server's side of both a calendar view and a local expansion."""
+    s, e = "2026-10-20T00:00:00", "2026-10-25T00:00:00"
+    window = {
+        "startDateTime": START.isoformat(),
+        "endDateTime": END.isoformat(),
+        "$select": "id,type,originalStart",
+        "$top": 1000,
+    }
+    view = [SINGLE, DAILY_MOVED, WEEKLY_MOVED]
+    view += [occurrence(DAILY, day) for day in (20, 23, 24)]
+    return {
+        url(
+            "/calendars/cal/calendarView",
+            startDateTime=START.astimezone().isoformat(),
+            endDateTime=END.astimezone().isoformat(),
+            **{"$top": 100},
+        ): {"value": view},
+        url(
+            "/calendars/cal/events",
+            **{
+                "$filter": (
+                    f"type eq 'singleInstance' and start/dateTime lt '{e}' "
+                    f"and end/dateTime gt '{s}'"
+                ),
+                "$top": 1000,
+            },
+        ): {"value": [SINGLE]},
+        url(
+            "/calendars/cal/events",
+            **{
+                "$filter": f"type eq 'seriesMaster' and start/dateTime lt '{e}'",
+                "$select": "id,changeKey,recurrence,start,end",
+                "$top": 1000,
+            },
+        ): {"value": [DAILY, WEEKLY]},
+        f"{GRAPH}/me/events/D": DAILY,
+        f"{GRAPH}/me/events/W": WEEKLY,
+        f"{GRAPH}/me/events/D22": DAILY_MOVED,
+        f"{GRAPH}/me/events/W26": WEEKLY_MOVED,
+        url("/events/D/instances", **window): instances(
+            ("D20", "occurrence", "2026-10-20T08:00:00"),
+            ("D22", "exception", "2026-10-22T08:00:00"),
+            ("D23", "occurrence", "2026-10-23T08:00:00"),
+            ("D24", "occurrence", "2026-10-24T08:00:00"),
+        ),
+        url("/events/W/instances", **window): instances(
+            ("W26", "exception", "2026-10-26T14:00:00")
+        ),
+    }
+
+
+def summary(events: list[dict]) -> list[tuple]:
+    return [(e["name"], e["body"], e["start_time"], e["end_time"]) for e in events]
+
+
+def test_local_recurrence_matches_calendar_view(replay_calendar):
+    calendar = replay_calendar(responses())
+    server = calendar.fetch_dict(START, END)
+    local = calendar.fetch_dict(START, END, local_recurrence=True)
+    assert len(server) == 6
+    assert summary(local) == summary(server)
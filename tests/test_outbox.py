@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from requests.adapters import HTTPAdapter
+
+from thallo.outbox import MIN_RETRY, Outbox
+
+
+class StandIn:
+    """
+    A stand-in Graph `$batch` endpoint. Each batch is answered by the next
+    of `replies`: a status for the whole batch, or a function from a request
+    to its response. Once they run out, every event is created.
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.replies = []
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stand_in.batches.append(body["requests"])
+                reply = stand_in.replies.pop(0) if stand_in.replies else created
+                if isinstance(reply, int):
+                    return self.send(reply, {"error": {"message": "refused"}})
+                self.send(200, {"responses": [reply(r) for r in body["requests"]]})
+
+            def send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *_):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def transaction_ids(self, batch: int) -> list[str]:
+        return [r["body"]["transactionId"] for r in self.batches[batch]]
+
+
+def created(request):
+    return {"id": request["id"], "status": 201, "body": {"id": "new"}}
+
+
+def refused(status, retry_after=None):
+    def reply(request):
+        headers = {"Retry-After": retry_after} if retry_after else {}
+        body = {"error": {"message": f"status {status}"}}
+        return {"id": request["id"], "status": status, "headers": headers, "body": body}
+
+    return reply
+
+
+@pytest.fixture
+def stand_in():
+    stand_in = StandIn()
+    yield stand_in
+    stand_in.server.shutdown()
+
+
+@pytest.fixture
+def calendar(stand_in, replay_calendar, monkeypatch):
+    calendar = replay_calendar()
+    # the stand-in is plain http, which the oauth session refuses
+    monkeypatch.setitem(os.environ, "OAUTHLIB_INSECURE_TRANSPORT", "1")
+    calendar.account.con.session.mount("http://", HTTPAdapter())
+    host, port = stand_in.server.server_address
+    calendar.account.protocol.service_url = f"http://{host}:{port}/"
+    return calendar
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = Outbox(tmp_path / "outbox.db")
+    yield outbox
+    outbox.close()
+
+
+def event(i: int) -> dict:
+    return {
+        "subject": f"Event {i}",
+        "start": {"dateTime": "2026-10-20T12:00:00", "timeZone": "UTC"},
+        "end": {"dateTime": "2026-10-20T13:00:00", "timeZone": "UTC"},
+    }
+
+
+def test_put_queues_with_transaction_id(outbox):
+    transaction_id = outbox.put(event(0))
+    (pending,) = outbox.pending()
+    assert pending["event"]["transactionId"] == transaction_id
+    assert pending["event"]["subject"] == "Event 0"
+    assert not pending["failed"]
+    assert outbox.due() == outbox.waiting() == 1
+
+
+def test_flush_sends_batches_of_twenty(outbox, calendar, stand_in):
+    for i in range(45):
+        outbox.put(event(i))
+    counts = outbox.flush(calendar)
+    assert counts == {"sent": 45, "retry": 0, "failed": 0, "waiting": 0}
+    assert [len(b) for b in stand_in.batches] == [20, 20, 5]
+    assert outbox.pending() == []
+
+
+def test_retry_reuses_transaction_id(outbox, calendar, stand_in):
+    outbox.put(event(0))
+    stand_in.replies = [refused(503), 503]
+    assert outbox.flush(calendar)["retry"] == 1
+    assert outbox.flush(calendar, force=True)["retry"] == 1
+    assert outbox.flush(calendar, force=True)["sent"] == 1
+    ids = [stand_in.transaction_ids(i) for i in range(3)]
+    assert ids[0] == ids[1] == ids[2]
+
+
+def test_backoff(outbox, calendar, stand_in):
+    outbox.put(event(0))
+    outbox.put(event(1))
+    stand_in.replies = [
+        lambda r: refused(429, "120")(r) if r["id"] == "1" else refused(503)(r)
+    ]
+    t = time.time()
+    assert outbox.flush(calendar)["retry"] == 2
+    first, second = outbox.pending()
+    assert first["next_attempt"] == pytest.approx(t + 120, abs=5)
+    assert second["next_attempt"] == pytest.approx(t + MIN_RETRY, abs=5)
+    assert second["error"] == "503: status 503"
+
+    # nothing is due until the backoff is over, but a forced flush sends
+    assert outbox.due() == 0
+    assert outbox.flush(calendar) == {"sent": 0, "retry": 0, "failed": 0, "waiting": 2}
+    assert len(stand_in.batches) == 1
+
+    stand_in.replies = [refused(503)]
+    t = time.time()
+    outbox.flush(calendar, force=True)
+    for pending in outbox.pending():
+        assert pending["attempts"] == 2
+        assert pending["next_attempt"] == pytest.approx(t + 2 * MIN_RETRY, abs=5)
+
+
+def test_refused_events_fail(outbox, calendar, stand_in):
+    for i in range(21):
+        outbox.put(event(i))
+    # the first batch is refused as a whole, and the second event by event
+    stand_in.replies = [400, refused(400)]
+    counts = outbox.flush(calendar)
+    assert counts == {"sent": 0, "retry": 0, "failed": 21, "waiting": 0}
+    assert all(p["failed"] for p in outbox.pending())
+    assert outbox.pending()[-1]["error"] == "400: status 400"
+
+    # failed events are not sent again, until discarded
+    assert outbox.flush(calendar, force=True)["sent"] == 0
+    assert len(stand_in.batches) == 2
+    assert outbox.discard_failed() == 21
+
+
+def test_throttled_batch_is_retried(outbox, calendar, stand_in):
+    for i in range(25):
+        outbox.put(event(i))
+    stand_in.replies = [created, 429]
+    counts = outbox.flush(calendar)
+    assert counts == {"sent": 20, "retry": 5, "failed": 0, "waiting": 5}
+
+
+def test_defer_keeps_error(outbox):
+    outbox.put(event(0))
+    outbox.defer("NoToken: no token")
+    (pending,) = outbox.pending()
+    assert pending["attempts"] == 1
+    assert pending["error"] == "NoToken: no token"
+    assert outbox.due() == 0
+
+
+def test_one_flush_at_a_time(outbox, calendar, stand_in, tmp_path):
+    outbox.put(event(0))
+    other = Outbox(tmp_path / "outbox.db")
+    lock = other._lock()
+    try:
+        assert outbox.flush(calendar) is None
+        assert stand_in.batches == []
+    finally:
+        lock.close()
+        other.close()
+    assert outbox.flush(calendar)["sent"] == 1
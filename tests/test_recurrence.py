@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from dateutil import rrule
+
+import thallo.recurrence as recurrence
+
+UTC = timezone.utc
+
+
+def master(pattern, start, duration=timedelta(hours=1), tz="UTC", **rng):
+    rng.setdefault("type", "noEnd")
+    rng.setdefault("startDate", start.date().isoformat())
+    rng.setdefault("recurrenceTimeZone", tz)
+    return {
+        "id": "M",
+        "start": {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%S"), "timeZone": tz},
+        "end": {
+            "dateTime": (start + duration).strftime("%Y-%m-%dT%H:%M:%S"),
+            "timeZone": tz,
+        },
+        "recurrence": {"pattern": pattern, "range": rng},
+    }
+
+
+def starts(m, window_start, window_end):
+    return [s for s, _ in recurrence.expand(m, window_start, window_end)]
+
+
+def rule_starts(rule, window_start, window_end):
+    return [d for d in rule if window_start <= d < window_end]
+
+
+WINDOW = (datetime(2026, 1, 1, tzinfo=UTC), datetime(2027, 1, 1, tzinfo=UTC))
+
+
+def test_weekly_every_other_week_sunday_start():
+    start = datetime(2026, 1, 6, 9, tzinfo=UTC)
+    m = master(
+        {
+            "type": "weekly",
+            "interval": 2,
+            "daysOfWeek": ["tuesday", "sunday"],
+            "firstDayOfWeek": "sunday",
+        },
+        start,
+    )
+    rule = rrule.rrule(
+        rrule.WEEKLY,
+        interval=2,
+        byweekday=(rrule.TU, rrule.SU),
+        wkst=rrule.SU,
+        dtstart=start,
+        until=WINDOW[1],
+    )
+    assert starts(m, *WINDOW) == rule_starts(rule, *WINDOW)
+
+
+def test_relative_monthly_last_friday():
+    start = datetime(2026, 1, 30, 16, tzinfo=UTC)
+    m = master(
+        {
+            "type": "relativeMonthly",
+            "interval": 1,
+            "daysOfWeek": ["friday"],
+            "index": "last",
+        },
+        start,
+    )
+    rule = rrule.rrule(
+        rrule.MONTHLY, byweekday=rrule.FR(-1), dtstart=start, until=WINDOW[1]
+    )
+    assert starts(m, *WINDOW) == rule_starts(rule, *WINDOW)
+
+
+def test_daily_every_third_day():
+    start = datetime(2026, 1, 2, 7, 30, tzinfo=UTC)
+    m = master({"type": "daily", "interval": 3}, start)
+    rule = rrule.rrule(rrule.DAILY, interval=3, dtstart=start, until=WINDOW[1])
+    assert starts(m, *WINDOW) == rule_starts(rule, *WINDOW)
+
+
+def test_absolute_monthly_31st_falls_back_to_last_day():
+    start = datetime(2026, 1, 31, 12, tzinfo=UTC)
+    m = master({"type": "absoluteMonthly", "interval": 1, "dayOfMonth": 31}, start)
+    # the last of the 28th to 31st that exists in each month
+    rule = rrule.rrule(
+        rrule.MONTHLY,
+        bymonthday=(28, 29, 30, 31),
+        bysetpos=-1,
+        dtstart=start,
+        until=WINDOW[1],
+    )
+    assert starts(m, *WINDOW) == rule_starts(rule, *WINDOW)
+
+
+def test_weekly_keeps_wall_clock_time_across_dst():
+    london = ZoneInfo("Europe/London")
+    start = datetime(2026, 10, 5, 9, tzinfo=london)
+    m = master(
+        {"type": "weekly", "interval": 1, "daysOfWeek": ["monday"]},
+        start,
+        tz="Europe/London",
+    )
+    window = (datetime(2026, 10, 1, tzinfo=UTC), datetime(2026, 11, 15, tzinfo=UTC))
+    rule = rrule.rrule(rrule.WEEKLY, byweekday=rrule.MO, dtstart=start, until=window[1])
+    got = starts(m, *window)
+    assert got == rule_starts(rule, *window)
+    # 08:00 UTC in summer time, 09:00 UTC after the clocks go back
+    assert [s.astimezone(UTC).hour for s in got] == [8, 8, 8, 9, 9, 9]
+
+
+def test_numbered_and_end_date_ranges():
+    start = datetime(2026, 3, 2, 9, tzinfo=UTC)
+    pattern = {"type": "daily", "interval": 1}
+    numbered = master(pattern, start, type="numbered", numberOfOccurrences=5)
+    assert len(starts(numbered, *WINDOW)) == 5
+    assert recurrence.last_end(numbered) == datetime(2026, 3, 6, 10, tzinfo=UTC)
+
+    until = master(pattern, start, type="endDate", endDate="2026-03-10")
+    assert len(starts(until, *WINDOW)) == 9
+    assert recurrence.last_end(until) == datetime(2026, 3, 10, 10, tzinfo=UTC)
+
+    assert recurrence.last_end(master(pattern, start)) is None
+
+
+@pytest.mark.parametrize("kind", ["weekly", "relativeMonthly", "relativeYearly"])
+def test_no_days_of_week_has_no_occurrences(kind):
+    start = datetime(2026, 1, 5, 9, tzinfo=UTC)
+    pattern = {
+        "type": kind,
+        "interval": 1,
+        "daysOfWeek": [],
+        "index": "first",
+        "month": 1,
+    }
+    assert starts(master(pattern, start), *WINDOW) == []
+
+
+def test_series_cache_drops_ended_series(tmp_path):
+    start = datetime(2026, 3, 2, 9, tzinfo=UTC)
+    pattern = {"type": "daily", "interval": 1}
+    cache = recurrence.SeriesCache(tmp_path / "series.json")
+    cache.put(
+        dict(master(pattern, start, type="endDate", endDate="2026-03-10"), id="E")
+    )
+    cache.put(dict(master(pattern, start), id="N"))
+
+    cache.prune(datetime(2026, 3, 10, 12, tzinfo=UTC))
+    assert list(cache.series) == ["N"]
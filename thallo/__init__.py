@@ -0,0 +1,11 @@
+# the client pulls in O365 and friends, so it is only imported when used
+def __getattr__(name):
+    if name == "Client":
+        from thallo.client import Client
+
+        return Client
+    if name == "AsyncCalendar":
+        from thallo.aio import AsyncCalendar
+
+        return AsyncCalendar
+    raise AttributeError(f"module 'thallo' has no attribute '{name}'")
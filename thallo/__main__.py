@@ -0,0 +1,3 @@
+from thallo.main import main
+
+main()
@@ -0,0 +1,173 @@
+"""
+An asyncio interface to the calendar, for embedding thallo in async services.
+"""
+
+import asyncio
+import functools
+import contextlib
+
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from thallo.calendar import Calendar, Event
+
+
+class AsyncCalendar:
+    """
+    Wraps a `Calendar` so that it can be used from an event loop. The blocking
+    work (requests and body conversion) runs in a thread pool shared by every
+    query, and all requests go through the one session of the calendar, so
+    they share its connection pool.
+
+    At most `max_concurrency` requests are in flight at once, and the rest
+    wait their turn. Each page holds a permit only while it is requested, so
+    a slow consumer of `stream` does not hold one; a `local_recurrence` query,
+    which makes its requests one after another, holds one while it runs.
+
+    The returned dicts follow the same schema as `Calendar.extract_fields`.
+    """
+
+    def __init__(self, calendar: Calendar, max_concurrency=4):
+        self.calendar = calendar
+        self.max_concurrency = max_concurrency
+        self._limit = asyncio.Semaphore(max_concurrency)
+        # each permit needs at most one thread for the request in flight and
+        # one for converting the page before it
+        self._executor = ThreadPoolExecutor(
+            max_workers=2 * max_concurrency, thread_name_prefix="thallo"
+        )
+
+    @classmethod
+    async def open(cls, max_concurrency=4, **kwargs) -> "AsyncCalendar":
+        """Create the underlying `Calendar` without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        calendar = await loop.run_in_executor(
+            None, functools.partial(Calendar, **kwargs)
+        )
+        return cls(calendar, max_concurrency=max_concurrency)
+
+    async def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    @staticmethod
+    def _convert(events: list[Event]) -> list[tuple[Event, dict]]:
+        return [(e, Calendar.extract_fields(e)) for e in events]
+
+    async def _get_page(self, url: str, params=None):
+        async with self._limit:
+            return await self._run(self.calendar.get_page, url, params)
+
+    async def _pages(self, start: datetime, end: datetime, page_size=None):
+        url, params = self.calendar.view_request(start, end, page_size)
+        pending = asyncio.ensure_future(self._get_page(url, params))
+        try:
+            while pending is not None:
+                events, next_link = await pending
+                # request the next page while this one is being used
+                pending = None
+                if next_link:
+                    pending = asyncio.ensure_future(self._get_page(next_link))
+                yield events
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def _stream_pairs(self, start: datetime, end: datetime, page_size=None):
+        async with contextlib.aclosing(self._pages(start, end, page_size)) as pages:
+            async for events in pages:
+                for pair in await self._run(self._convert, events):
+                    yield pair
+
+    async def stream(self, start: datetime, end: datetime, page_size=None):
+        """
+        Yield the events between two dates as dicts, page by page, in the
+        order the server returns them. The next page is requested while one
+        is consumed; to cancel it on leaving the loop early, close the stream
+        with `contextlib.aclosing`:
+
+            async with contextlib.aclosing(calendar.stream(start, end)) as events:
+                async for event in events:
+                    ...
+        """
+        # closing `stream` closes the pages, cancelling the one in flight
+        async with contextlib.aclosing(
+            self._stream_pairs(start, end, page_size)
+        ) as pairs:
+            async for _, event in pairs:
+                yield event
+
+    async def fetch(
+        self,
+        start: datetime,
+        end: datetime,
+        sort=True,
+        local_recurrence=False,
+        page_size=None,
+    ) -> list[Event]:
+        """
+        Fetch calendar events between two given dates.
+        """
+        if local_recurrence:
+            async with self._limit:
+                return await self._run(
+                    self.calendar.fetch, start, end, sort=sort, local_recurrence=True
+                )
+
+        events = []
+        async with contextlib.aclosing(self._pages(start, end, page_size)) as pages:
+            async for page in pages:
+                events += page
+        if sort:
+            events.sort(key=lambda e: e.start)
+        return events
+
+    async def fetch_dict(
+        self,
+        start: datetime,
+        end: datetime,
+        sort=True,
+        local_recurrence=False,
+        page_size=None,
+    ) -> list[dict]:
+        """
+        Fetch calendar events between two given dates, extracting and cleaning
+        the fields into a pre-defined schema.
+        """
+        if local_recurrence:
+            async with self._limit:
+                return await self._run(
+                    self.calendar.fetch_dict,
+                    start,
+                    end,
+                    sort=sort,
+                    local_recurrence=True,
+                )
+
+        async with contextlib.aclosing(
+            self._stream_pairs(start, end, page_size)
+        ) as stream:
+            pairs = [p async for p in stream]
+        if sort:
+            pairs.sort(key=lambda p: p[1]["start_time"])
+
+        if self.calendar.index is not None:
+            await self._run(
+                self.calendar.index.update,
+                start,
+                end,
+                [(e.object_id, d) for e, d in pairs],
+            )
+
+        return [d for _, d in pairs]
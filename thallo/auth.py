@@ -23,7 +23,6 @@
 
 import sys
 import json
-import subprocess
 import logging
 import secrets
 import base64
@@ -38,7 +37,8 @@ from pathlib import Path
 
 from datetime import timedelta, datetime
 
-import thallo.utils as utils
+import thallo.cassette
+import thallo.store
 
 logger = logging.getLogger(__name__)
 
@@ -49,14 +49,6 @@ class NoToken(Exception):
     pass
 
 
-ENCRYPTION_PIPE = [
-    "gpg",
-    "--encrypt",
-    "--recipient",
-    utils.get_gpg_recipient(),
-]
-DECRYPTION_PIPE = ["gpg", "--decrypt"]
-
 REGISTRATIONS = {
     "microsoft": {
         "authorize_endpoint": "https://login.microsoftonline.com/common/oauth2/v2.0/authorize",
@@ -80,47 +72,21 @@ REGISTRATIONS = {
 }
 
 
-def encrypt_and_save(path: Path, token: dict):
-    sub2 = subprocess.run(
-        encryption_pipe,
-        check=true,
-        input=json.dumps(token).encode(),
-        capture_output=true,
-    )
-    path.write_bytes(sub2.stdout)
-
-
-def load_and_decrypt(path: Path) -> dict:
-    sub = subprocess.run(
-        DECRYPTION_PIPE,
-        check=True,
-        input=path.read_bytes(),
-        capture_output=True,
-    )
-    return json.loads(sub.stdout)
-
-
-def run(path: Path, authorize=False, email=None):
+def run(
+    path: Path, authorize=False, email=None, store: thallo.store.TokenStore = None
+) -> dict:
+    """
+    Check the token at `path`, refreshing (or with `authorize`, fetching) it
+    as needed, and return it.
+    """
+    store = store or thallo.store.get_store()
     token = {}
     if path.exists():
         if 0o777 & path.stat().st_mode != 0o600:
             raise Exception(
                 "Token file has unsafe mode. Suggest deleting and starting over."
             )
-        try:
-            sub = subprocess.run(
-                DECRYPTION_PIPE,
-                check=True,
-                input=path.read_bytes(),
-                capture_output=True,
-            )
-            token = json.loads(sub.stdout)
-        except subprocess.CalledProcessError:
-            raise Exception(
-                "Difficulty decrypting token file. Is your decryption agent primed for "
-                "non-interactive usage, or an appropriate environment variable such as "
-                "GPG_TTY set to allow interactive agent usage from inside a pipe?"
-            )
+        token = store.load(path)
 
     def writetokenfile():
         """Writes global token dictionary into token file."""
@@ -130,13 +96,7 @@ def run(path: Path, authorize=False, email=None):
             raise Exception(
                 "Token file has unsafe mode. Suggest deleting and starting over."
             )
-        sub2 = subprocess.run(
-            ENCRYPTION_PIPE,
-            check=True,
-            input=json.dumps(token).encode(),
-            capture_output=True,
-        )
-        path.write_bytes(sub2.stdout)
+        store.save(path, token)
 
     if not token:
         if not authorize:
@@ -283,7 +243,7 @@ def run(path: Path, authorize=False, email=None):
             }
         )
         try:
-            response = urllib.request.urlopen(
+            response = thallo.cassette.urlopen(
                 registration["token_endpoint"], urllib.parse.urlencode(p).encode()
             )
         except urllib.error.HTTPError as err:
@@ -312,7 +272,7 @@ def run(path: Path, authorize=False, email=None):
             }
         )
         try:
-            response = urllib.request.urlopen(
+            response = thallo.cassette.urlopen(
                 registration["token_endpoint"], urllib.parse.urlencode(p).encode()
             )
         except urllib.error.HTTPError as err:
@@ -346,3 +306,5 @@ def run(path: Path, authorize=False, email=None):
         if registration["sasl_method"] == "XOAUTH2":
             return f"user={user}\1auth=Bearer {bearer_token}\1\1"
         raise Exception(f'Unknown SASL method {registration["sasl_method"]}.')
+
+    return token
@@ -1,14 +1,21 @@
 import os
 import json
+import queue
+import functools
+import threading
 import subprocess
 
 from zoneinfo import ZoneInfo
 from datetime import datetime, timedelta, timezone
 
 import thallo.auth
+import thallo.cassette
+import thallo.store
+import thallo.recurrence as recurrence
 import thallo.utils as utils
 
 from O365 import Account
+from O365.connection import MSGraphProtocol
 from O365.calendar import Calendar, Event, Attendee
 from O365.utils.token import BaseTokenBackend, Token
 
@@ -22,36 +29,44 @@ FIELDS_TO_SAVE = [
 
 HUMAN_TIME_FORMAT = "%d/%m/%Y %H:%M UTC"
 
+# number of events requested per page of a calendar view
+DEFAULT_PAGE_SIZE = 100
+# the largest page Graph serves
+MAX_PAGE_SIZE = 1000
+# number of pages requested ahead of the one being processed
+DEFAULT_PREFETCH = 1
+
 
 def cleanup_string(s: str) -> str:
     lines = [l.strip() for l in s.strip().split("\n")]
     return "\n".join([l for l in lines if l != ""])
 
 
+@functools.lru_cache(maxsize=512)
+def convert_body(body: str) -> str:
+    """Convert an HTML body to markdown. Occurrences of a series share a body,
+    so the conversion is only done once for each."""
+    return cleanup_string(md(body))
+
+
 class Token(BaseTokenBackend):
 
-    def __init__(self, token_path=utils.get_token_path()):
+    def __init__(self, token_path=None, store: thallo.store.TokenStore = None):
         super().__init__()
         self.token_is_valid = False
         self.decrypted_token = None
-        self.token_path = token_path
+        self.token_path = token_path or utils.get_token_path()
+        self.store = store or thallo.store.get_store()
+        # serialises reads, writes and refreshes between threads sharing this
+        # token, so that only one of them refreshes an expired token
+        self.lock = threading.RLock()
 
     def _read_token_file(self) -> dict:
         """
         Read an access token from file.
         """
-        # first we check the token is okay / refresh for good luck
-        thallo.auth.run(self.token_path)
-
-        if not self.token_path.exists():
-            raise Exception("Token not found")
-
-        if 0o777 & self.token_path.stat().st_mode != 0o600:
-            raise Exception(
-                "Token file has unsafe mode. Suggest deleting and starting over."
-            )
-
-        return thallo.auth.load_and_decrypt(self.token_path)
+        # check the token is okay / refresh for good luck, which also reads it
+        return thallo.auth.run(self.token_path, store=self.store)
 
     def _write_token_file(self) -> None:
         """
@@ -65,7 +80,7 @@ class Token(BaseTokenBackend):
                 "Token file has unsafe mode. Suggest deleting and starting over."
             )
 
-        thallo.auth.encrypt_and_save(self.token_path, self.decrypted_token)
+        self.store.save(self.token_path, self.decrypted_token)
 
     def _access_token_valid(self) -> bool:
         """
@@ -75,25 +90,90 @@ class Token(BaseTokenBackend):
         return token_exp and datetime.now() < datetime.fromisoformat(token_exp)
 
     def load_token(self):
-        self.decrypted_token = self._read_token_file()
-        return self.decrypted_token
+        with self.lock:
+            token = self._read_token_file()
+            # let the session know when the access token expires, so that it
+            # asks for a refresh instead of sending a stale token
+            if token.get("access_token_expiration"):
+                expiration = datetime.fromisoformat(token["access_token_expiration"])
+                token["expires_at"] = expiration.timestamp()
+            self.decrypted_token = token
+            return self.decrypted_token
 
     def save_token(self):
-        for field in FIELDS_TO_SAVE:
-            self.decrypted_token[field] = self.token[field]
-        self._write_token_file()
+        with self.lock:
+            for field in FIELDS_TO_SAVE:
+                self.decrypted_token[field] = self.token[field]
+            self._write_token_file()
 
-    def should_refresh_token(self):
-        if not self.decrypted_token:
-            return False
-        self.token_is_valid = self._access_token_valid()
-        return self.token_is_valid
+    def should_refresh_token(self, con=None):
+        """
+        Refresh an expired access token through `thallo.auth`. Threads that
+        find the token expired wait on the lock, and all but the first then
+        pick up the token it refreshed. Returns False, so that the connection
+        uses the token now stored here rather than refreshing it itself.
+        """
+        with self.lock:
+            self.token_is_valid = bool(
+                self.decrypted_token and self._access_token_valid()
+            )
+            if not self.token_is_valid:
+                self.get_token()
+                self.token_is_valid = True
+        return False
+
+
+def fill_event(
+    ev: Event,
+    start: datetime,
+    end: datetime,
+    title="New Meeting",
+    private=False,
+    location=None,
+    attendees=None,
+    body=None,
+) -> Event:
+    start = start.astimezone(timezone.utc).replace(tzinfo=ZoneInfo("UTC"))
+    end = end.astimezone(timezone.utc).replace(tzinfo=ZoneInfo("UTC"))
+
+    ev.subject = title
+    ev.start = start
+    ev.end = end
+
+    if private:
+        ev.sensitivity = "private"
+
+    if body:
+        ev.body = body
+        ev.body_type = "text"
+
+    if location:
+        ev.location["uniqueId"] = location
+
+    # each attendee is an address, or a dict of its `address` and `name`
+    if attendees:
+        for attendee in attendees:
+            if isinstance(attendee, str):
+                attendee = {"address": attendee}
+            ev.attendees.add(
+                Attendee(attendee["address"].strip(), name=attendee.get("name"))
+            )
+
+    return ev
 
 
 class Calendar:
 
-    def __init__(self):
-        self.token = Token()
+    def __init__(self, token=None, index=None, root_dir=None):
+        self.index = index
+        self.root_dir = root_dir or utils.get_root_dir()
+        self._series_lock = threading.Lock()
+        cassette = thallo.cassette.active()
+
+        if cassette and cassette.replaying:
+            self.token = thallo.cassette.ReplayToken()
+        else:
+            self.token = token or Token()
         self.token.load_token()
 
         self.account = Account(
@@ -103,40 +183,306 @@ class Calendar:
             ),
             token_backend=self.token,
         )
+
+        if cassette:
+            con = self.account.con
+            con.session = con.get_session(load_token=True)
+            cassette.mount(con.session)
+            if cassette.replaying:
+                con.requests_delay = 0
+
         self.schedule = self.account.schedule()
         self.calendar = self.schedule.get_default_calendar()
 
-    def fetch(self, start: datetime, end: datetime, sort=True) -> list[Event]:
+    def fetch(
+        self,
+        start: datetime,
+        end: datetime,
+        sort=True,
+        local_recurrence=False,
+        page_size=None,
+        prefetch=DEFAULT_PREFETCH,
+    ) -> list[Event]:
         """
-        Fetch calendar events between two given dates.
+        Fetch calendar events between two given dates. With `local_recurrence`,
+        recurring series are expanded locally from cached series masters
+        rather than by the server.
         """
-        query = self.calendar.new_query("start").greater_equal(start)
-        query.chain("and").on_attribute("end").less_equal(end)
-
-        events = self.calendar.get_events(query=query, include_recurring=True)
-        evs = [e for e in events]
+        if local_recurrence:
+            evs = self.fetch_local_recurrence(start, end)
+        else:
+            pages = self.iter_pages(start, end, page_size=page_size, prefetch=prefetch)
+            evs = [e for page in pages for e in page]
 
         if sort:
             return [i for i in sorted(evs, key=lambda i: i.start)]
         return evs
 
-    def fetch_dict(self, start: datetime, end: datetime, **kwargs) -> list[dict]:
+    def _get_all(self, endpoint: str, params=None) -> list[dict]:
+        """
+        Fetch every page of a collection in the largest pages the server
+        allows, returning the raw cloud data.
+        """
+        url = self.calendar.build_url(endpoint)
+        params = dict(params or {}, **{"$top": MAX_PAGE_SIZE})
+        values = []
+        while url:
+            data = self.account.con.get(url, params=params).json()
+            values += data.get("value", [])
+            # the next link already carries the query parameters
+            url = data.get("@odata.nextLink", None)
+            params = None
+        return values
+
+    def _get_one(self, endpoint: str) -> dict:
+        return self.account.con.get(self.calendar.build_url(endpoint)).json()
+
+    def _series_cache(self) -> recurrence.SeriesCache:
+        if not hasattr(self, "series_cache"):
+            self.series_cache = recurrence.SeriesCache(self.root_dir / "series.json")
+        return self.series_cache
+
+    def _update_series(self, entry: dict, start: datetime, end: datetime):
+        """
+        Find the exceptions and cancelled occurrences of a series in a window.
+        Only the times of the instances are requested; exceptions are then
+        fetched in full. The instances are requested even if the series has
+        no regular occurrence in the window, as one may have been moved into
+        it.
+        """
+        occurrences = recurrence.expand(entry["master"], start, end)
+        master_id = entry["master"]["id"]
+        server = self._get_all(
+            f"/events/{master_id}/instances",
+            params={
+                "startDateTime": start.isoformat(),
+                "endDateTime": end.isoformat(),
+                "$select": "id,type,originalStart",
+            },
+        )
+        seen = set()
+        for inst in server:
+            key = recurrence.original_start_key(inst["originalStart"])
+            seen.add(key)
+            if inst["type"] == "exception":
+                entry["exceptions"][key] = self._get_one(f"/events/{inst['id']}")
+
+        for occ_start, _ in occurrences:
+            key = recurrence.original_start_key(occ_start)
+            if key not in seen and key not in entry["cancelled"]:
+                entry["cancelled"].append(key)
+
+        recurrence.SeriesCache.add_covered(entry, start, end)
+
+    def fetch_local_recurrence(self, start: datetime, end: datetime) -> list[Event]:
+        """
+        Fetch the single events in a window in full, but only the ids of the
+        series masters. Masters that changed since they were cached are
+        fetched once, and their occurrences expanded locally.
+        """
+        start = start.astimezone(timezone.utc)
+        end = end.astimezone(timezone.utc)
+        s = start.strftime(recurrence.GRAPH_TIME_FORMAT)
+        e = end.strftime(recurrence.GRAPH_TIME_FORMAT)
+
+        events_endpoint = f"/calendars/{self.calendar.calendar_id}/events"
+        singles = self._get_all(
+            events_endpoint,
+            params={
+                "$filter": (
+                    f"type eq 'singleInstance' and start/dateTime lt '{e}' "
+                    f"and end/dateTime gt '{s}'"
+                ),
+            },
+        )
+        masters = self._get_all(
+            events_endpoint,
+            params={
+                "$filter": f"type eq 'seriesMaster' and start/dateTime lt '{e}'",
+                "$select": "id,changeKey,recurrence,start,end",
+            },
+        )
+
+        raw = singles
+        with self._series_lock:
+            cache = self._series_cache()
+            cache.prune(start)
+            for m in masters:
+                # series that ended before the window cost no requests
+                ended = recurrence.last_end(m)
+                if ended is not None and ended <= start:
+                    continue
+                entry = cache.get(m["id"], m["changeKey"])
+                if entry is None:
+                    entry = cache.put(self._get_one(f"/events/{m['id']}"))
+                if not cache.covers(entry, start, end):
+                    self._update_series(entry, start, end)
+                raw += recurrence.instances(entry, start, end)
+            cache.save()
+
+        return [self.to_event(i) for i in raw]
+
+    def view_request(
+        self, start: datetime, end: datetime, page_size=None
+    ) -> tuple[str, dict]:
+        """
+        The URL and parameters of the first page of the calendar view between
+        two dates, in which the server expands recurring events.
+        """
+        url = self.calendar.build_url(
+            f"/calendars/{self.calendar.calendar_id}/calendarView"
+        )
+        params = {
+            "startDateTime": start.astimezone().isoformat(),
+            "endDateTime": end.astimezone().isoformat(),
+        }
+        page_size = page_size or DEFAULT_PAGE_SIZE
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f"Page size must be from 1 to {MAX_PAGE_SIZE}")
+        params["$top"] = page_size
+        return url, params
+
+    def iter_pages(
+        self, start: datetime, end: datetime, page_size=None, prefetch=DEFAULT_PREFETCH
+    ):
+        """
+        Yield the events between two dates page by page. A background thread
+        requests up to `prefetch` pages ahead of the one being consumed, so
+        the network and the processing of the events overlap.
+        """
+        url, params = self.view_request(start, end, page_size)
+
+        if prefetch <= 0:
+            while url:
+                events, url = self.get_page(url, params)
+                params = None
+                yield events
+            return
+
+        pages = queue.Queue(maxsize=prefetch)
+        done = threading.Event()
+
+        def put(item):
+            # give up if the consumer has gone away
+            while not done.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce(url, params):
+            try:
+                while url:
+                    events, url = self.get_page(url, params)
+                    params = None
+                    if not put(events):
+                        return
+                put(None)
+            except Exception as e:
+                put(e)
+
+        threading.Thread(target=produce, args=(url, params), daemon=True).start()
+        try:
+            while True:
+                item = pages.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            done.set()
+
+    def get_page(self, url: str, params=None) -> tuple[list[Event], str | None]:
+        """
+        Fetch a single page of events, returning the events and the link to
+        the next page, if there is one.
+        """
+        data = self.account.con.get(url, params=params).json()
+        events = [self.to_event(i) for i in data.get("value", [])]
+        return events, data.get("@odata.nextLink", None)
+
+    def delta(
+        self, start: datetime = None, end: datetime = None, link: str = None
+    ) -> tuple[list[dict], str]:
+        """
+        Fetch the changes to the calendar view between two dates since the
+        given delta link, or every event in the view if there is no link yet.
+        Returns the raw cloud data of the changed events (removed events are
+        marked with `@removed`) and the delta link for the next call.
+        """
+        if link is None:
+            url = self.calendar.build_url(
+                f"/calendars/{self.calendar.calendar_id}/calendarView/delta"
+            )
+            params = {
+                "startDateTime": start.astimezone().isoformat(),
+                "endDateTime": end.astimezone().isoformat(),
+            }
+        else:
+            url, params = link, None
+
+        values = []
+        while True:
+            data = self.account.con.get(url, params=params).json()
+            values += data.get("value", [])
+            if "@odata.nextLink" not in data:
+                return values, data.get("@odata.deltaLink", None)
+            url, params = data["@odata.nextLink"], None
+
+    def to_event(self, cloud_data: dict) -> Event:
+        """Build an event from the raw cloud data returned by the server."""
+        key = self.calendar._cloud_data_key
+        return self.calendar.event_constructor(
+            parent=self.calendar, **{key: cloud_data}
+        )
+
+    def fetch_dict(
+        self,
+        start: datetime,
+        end: datetime,
+        sort=True,
+        local_recurrence=False,
+        page_size=None,
+        prefetch=DEFAULT_PREFETCH,
+    ) -> list[dict]:
         """
         Fetch calendar events between two given dates, extracting and cleaning
-        the fields into a pre-defined schema.
+        the fields into a pre-defined schema. Each page is converted while the
+        next is being fetched.
         """
-        return [self.extract_fields(i) for i in self.fetch(start, end, **kwargs)]
+        if local_recurrence:
+            events = self.fetch_local_recurrence(start, end)
+            pairs = [(e, self.extract_fields(e)) for e in events]
+        else:
+            pages = self.iter_pages(start, end, page_size=page_size, prefetch=prefetch)
+            pairs = [(e, self.extract_fields(e)) for page in pages for e in page]
+
+        if sort:
+            pairs.sort(key=lambda p: p[1]["start_time"])
+
+        if self.index is not None:
+            self.index.update(start, end, [(e.object_id, d) for e, d in pairs])
+
+        return [d for _, d in pairs]
 
     @staticmethod
     def extract_fields(event: Event, parse_body=True) -> dict:
         attendees = [{"name": i.name, "address": i.address} for i in event.attendees]
         location = event.location
+        organizer = event.organizer
+        if organizer:
+            organizer = {"name": organizer.name, "address": organizer.address}
+        else:
+            organizer = None
 
         if parse_body:
             if event.body_type == "text":
                 body = event.body
             else:
-                body = cleanup_string(md(event.body))
+                body = convert_body(event.body)
         else:
             body = event.body
 
@@ -144,47 +490,35 @@ class Calendar:
             "name": event.attachment_name,
             "body": body,
             "attendees": attendees,
+            "organizer": organizer,
             "location": location,
             "start_time": event.start,
             "end_time": event.end,
         }
         return e
 
-    def add_event(
-        self,
-        start: datetime,
-        end: datetime,
-        title="New Meeting",
-        private=False,
-        location=None,
-        attendees=None,
-        body=None,
-    ) -> Event:
-        start = start.astimezone(timezone.utc).replace(tzinfo=ZoneInfo("UTC"))
-        end = end.astimezone(timezone.utc).replace(tzinfo=ZoneInfo("UTC"))
-
-        ev = self.calendar.new_event()
-        ev.subject = title
-        ev.start = start
-        ev.end = end
-
-        if private:
-            ev.sensitivity = "private"
+    def add_event(self, start: datetime, end: datetime, **kwargs) -> Event:
+        return fill_event(self.calendar.new_event(), start, end, **kwargs)
 
-        if body:
-            ev.body = body
-            ev.body_type = "text"
-
-        if location:
-            ev.location["uniqueId"] = location
-
-        if attendees:
-            for address in attendees:
-                ev.attendees.add(Attendee(address.strip()))
+    @staticmethod
+    def draft_event(start: datetime, end: datetime, **kwargs) -> Event:
+        """
+        A new event that belongs to no connected calendar, so that it can be
+        written offline and queued (see `thallo.outbox`).
+        """
+        return fill_event(Event(protocol=MSGraphProtocol()), start, end, **kwargs)
 
-        return ev
+    def batch(self, requests: list[dict]) -> dict[str, dict]:
+        """
+        Send up to 20 requests as one JSON batch, returning the responses by
+        request id.
+        """
+        url = self.account.protocol.service_url + "$batch"
+        response = self.account.con.post(url, data={"requests": requests})
+        return {r["id"]: r for r in response.json()["responses"]}
 
-    def serialize_event(self, event: Event) -> str:
+    @staticmethod
+    def serialize_event(event: Event) -> str:
         d = Calendar.extract_fields(event)
 
         start_time = d["start_time"].strftime(HUMAN_TIME_FORMAT)
@@ -203,7 +537,8 @@ class Calendar:
         buf += f"Body: {body}"
         return buf
 
-    def deserialize_event(self, content: str) -> None | Event:
+    @staticmethod
+    def deserialize_event(content: str) -> None | Event:
         lines = (i for i in content.split("\n"))
 
         def get_next(s: str) -> str:
@@ -221,7 +556,7 @@ class Calendar:
         _ = get_next("Body:")
         body = "\n".join(lines)
 
-        return self.add_event(
+        return Calendar.draft_event(
             start_time,
             end_time,
             title=title,
@@ -0,0 +1,307 @@
+import io
+import json
+import pathlib
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from O365.utils.token import BaseTokenBackend
+
+REDACTED = "REDACTED"
+
+# any field in a JSON body, form body or query string with one of these names
+# has its value replaced before it is written to disk
+SECRET_FIELDS = {
+    "access_token",
+    "refresh_token",
+    "id_token",
+    "client_secret",
+    "code_verifier",
+    "password",
+}
+# on token endpoints, `code` is the authorization code (elsewhere it is an
+# error code that replays need)
+TOKEN_SECRET_FIELDS = SECRET_FIELDS | {"code"}
+
+FORM_TYPE = "application/x-www-form-urlencoded"
+
+SECRET_HEADERS = {"authorization", "cookie", "set-cookie"}
+
+# these no longer describe the body once it has been decoded and redacted
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+# the cassette in use for this process, if any
+_active = None
+
+
+def use(cassette):
+    """Route all HTTP traffic of this process through a cassette."""
+    global _active
+    _active = cassette
+
+
+def active():
+    return _active
+
+
+def secret_fields(url: str) -> set:
+    """The names of the fields to redact in an exchange with `url`."""
+    path = urllib.parse.urlsplit(url).path
+    return TOKEN_SECRET_FIELDS if path.endswith("/token") else SECRET_FIELDS
+
+
+def _redact_json(obj, secrets=SECRET_FIELDS):
+    if isinstance(obj, dict):
+        return {
+            k: (REDACTED if k in secrets else _redact_json(v, secrets))
+            for k, v in obj.items()
+        }
+    if isinstance(obj, list):
+        return [_redact_json(i, secrets) for i in obj]
+    return obj
+
+
+def _redact_pairs(pairs: list, secrets=SECRET_FIELDS) -> list:
+    return [(k, REDACTED if k in secrets else v) for k, v in pairs]
+
+
+def redact_url(url: str) -> str:
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    query = urllib.parse.urlencode(_redact_pairs(query, secret_fields(url)))
+    return urllib.parse.urlunsplit(parts._replace(query=query))
+
+
+def redact_body(body, content_type="", secrets=SECRET_FIELDS) -> str:
+    """
+    Redact a JSON or form body. Any other body is stored as it is, so that
+    it replays exactly.
+    """
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode(errors="replace")
+    if body == "":
+        return body
+    if FORM_TYPE in (content_type or "").lower():
+        pairs = urllib.parse.parse_qsl(body, keep_blank_values=True)
+        return urllib.parse.urlencode(_redact_pairs(pairs, secrets))
+    try:
+        return json.dumps(_redact_json(json.loads(body), secrets))
+    except ValueError:
+        return body
+
+
+def redact_headers(headers) -> dict:
+    return {
+        k: (REDACTED if k.lower() in SECRET_HEADERS else v)
+        for k, v in headers.items()
+        if k.lower() not in DROPPED_HEADERS
+    }
+
+
+class CassetteMiss(Exception):
+    """No recorded exchange matches a request made during replay."""
+
+    pass
+
+
+class Cassette:
+    """
+    A directory of recorded HTTP exchanges. Each exchange is stored as a
+    numbered JSON file, with tokens and secrets redacted.
+    """
+
+    def __init__(self, path, mode="replay"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode '{mode}'")
+
+        self.path = pathlib.Path(path)
+        self.mode = mode
+        self._exchanges = {}
+        self._last = {}
+        self._lock = threading.Lock()
+
+        if self.recording:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._count = len(list(self.path.glob("*.json")))
+        else:
+            for f in sorted(self.path.glob("*.json")):
+                exchange = json.loads(f.read_text())
+                key = self._key(
+                    exchange["request"]["method"], exchange["request"]["url"]
+                )
+                self._exchanges.setdefault(key, []).append(exchange)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def _key(method: str, url: str) -> tuple:
+        return (method.upper(), redact_url(url))
+
+    def record(self, method, url, headers, body, status, reason, res_headers, content):
+        secrets = secret_fields(url)
+        headers = CaseInsensitiveDict(headers)
+        res_headers = CaseInsensitiveDict(res_headers)
+        exchange = {
+            "request": {
+                "method": method.upper(),
+                "url": redact_url(url),
+                "headers": redact_headers(headers),
+                "body": redact_body(body, headers.get("Content-Type"), secrets),
+            },
+            "response": {
+                "status": status,
+                "reason": reason,
+                "headers": redact_headers(res_headers),
+                "body": redact_body(content, res_headers.get("Content-Type"), secrets),
+            },
+        }
+        text = json.dumps(exchange, indent=1)
+        with self._lock:
+            # a detached child may be recording to the same directory
+            while True:
+                self._count += 1
+                try:
+                    with open(self.path / f"{self._count:05d}.json", "x") as f:
+                        f.write(text)
+                    break
+                except FileExistsError:
+                    pass
+
+    def play(self, method: str, url: str) -> dict:
+        """
+        Return the next recorded response for a request. Exchanges for the same
+        request are served in the order they were recorded, with the last one
+        repeated once they run out.
+        """
+        key = self._key(method, url)
+        with self._lock:
+            queue = self._exchanges.get(key, [])
+            if queue:
+                self._last[key] = queue.pop(0)
+            if key not in self._last:
+                raise CassetteMiss(f"No recorded exchange for {key[0]} {key[1]}")
+            return self._last[key]["response"]
+
+    def mount(self, session):
+        """Mount a recording or replaying adapter on a requests session."""
+        adapter = (
+            RecordingAdapter(
+                self, max_retries=session.get_adapter("https://").max_retries
+            )
+            if self.recording
+            else ReplayAdapter(self)
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    def urlopen(self, url: str, data=None):
+        """Stand-in for `urllib.request.urlopen` that goes through the cassette."""
+        method = "GET" if data is None else "POST"
+
+        if self.replaying:
+            return io.BytesIO(self.play(method, url)["body"].encode())
+
+        try:
+            response = urllib.request.urlopen(url, data)
+        except urllib.error.HTTPError as err:
+            response = err
+        content = response.read()
+        self.record(
+            method,
+            url,
+            # what urllib sends with data
+            {"Content-Type": FORM_TYPE} if data is not None else {},
+            data,
+            response.status,
+            response.reason,
+            dict(response.headers),
+            content,
+        )
+        return io.BytesIO(content)
+
+
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self, cassette: Cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        self.cassette.record(
+            request.method,
+            request.url,
+            request.headers,
+            request.body,
+            response.status_code,
+            response.reason,
+            response.headers,
+            response.content,
+        )
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    def __init__(self, cassette: Cassette):
+        super().__init__()
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        recorded = self.cassette.play(request.method, request.url)
+        response = Response()
+        response.status_code = recorded["status"]
+        response.reason = recorded["reason"]
+        response.headers = CaseInsensitiveDict(recorded["headers"])
+        response._content = (recorded["body"] or "").encode()
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class ReplayToken(BaseTokenBackend):
+    """Token backend that hands out a placeholder token without touching gpg."""
+
+    def __init__(self):
+        super().__init__()
+        self.decrypted_token = {
+            "client_id": REDACTED,
+            "client_secret": REDACTED,
+            "access_token": REDACTED,
+            "refresh_token": REDACTED,
+            "token_type": "Bearer",
+            "expires_at": 2**32,
+        }
+
+    def load_token(self):
+        return self.decrypted_token
+
+    def save_token(self):
+        pass
+
+    def should_refresh_token(self, con=None):
+        return False
+
+
+def urlopen(url: str, data=None):
+    """
+    Open a URL, recording or replaying the exchange if a cassette is in use.
+    """
+    if _active is None:
+        return urllib.request.urlopen(url, data)
+    return _active.urlopen(url, data)
@@ -0,0 +1,184 @@
+import typing
+import pathlib
+import threading
+
+from datetime import datetime, timedelta
+
+import thallo.store
+import thallo.utils as utils
+
+from thallo.index import EventIndex
+from thallo.outbox import Outbox
+
+# the calendar (and with it O365) is only imported once it is needed
+if typing.TYPE_CHECKING:
+    from thallo.calendar import Calendar, Event
+
+
+class Client:
+    """
+    A reusable handle on an Outlook calendar, for use as a library.
+
+    Settings are given explicitly rather than read from global state, so any
+    number of clients with different settings can live in one process:
+
+    - `profile` selects a directory under `~/.thallo/profiles/` for the token,
+      configuration and caches (the default is `~/.thallo` itself).
+    - `token_path` and `config_path` override the token file and the
+      configuration file of the profile.
+    - `gpg_recipient` overrides the recipient set in the configuration file.
+    - `token_store` overrides the token store (`gpg` or `aead`, see
+      `thallo.store`) set in the configuration file.
+    - `index` keeps the local event index up to date on each fetch.
+
+    The connection is made on first use. A client is safe to share between
+    threads: they share one session (and so one connection pool), and an
+    expired token is refreshed by one thread while the others wait for it.
+
+        with thallo.Client() as client:
+            events = client.fetch(start, end)
+    """
+
+    def __init__(
+        self,
+        token_path: pathlib.Path = None,
+        profile: str = None,
+        config_path: pathlib.Path = None,
+        gpg_recipient: str = None,
+        token_store: str = None,
+        index=True,
+    ):
+        self.root_dir = utils.get_root_dir(profile)
+        self.token_path = token_path or utils.get_token_path(self.root_dir)
+        self.config_path = config_path or utils.get_config_path(self.root_dir)
+        self.gpg_recipient = gpg_recipient
+        self.token_store = token_store
+        self.use_index = index
+
+        self._lock = threading.Lock()
+        self._calendar = None
+        self._index = None
+        self._outbox = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._calendar is not None:
+                session = self._calendar.account.con.session
+                if session is not None:
+                    session.close()
+                self._calendar = None
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+            if self._outbox is not None:
+                self._outbox.close()
+                self._outbox = None
+
+    def store(self) -> thallo.store.TokenStore:
+        return thallo.store.get_store(
+            self.config_path, recipient=self.gpg_recipient, name=self.token_store
+        )
+
+    @property
+    def index(self) -> EventIndex | None:
+        if not self.use_index:
+            return None
+        with self._lock:
+            if self._index is None:
+                self._index = EventIndex(utils.get_index_path(self.root_dir))
+            return self._index
+
+    @property
+    def outbox(self) -> Outbox:
+        """The queue of events waiting to be created."""
+        with self._lock:
+            if self._outbox is None:
+                self._outbox = Outbox(utils.get_outbox_path(self.root_dir))
+            return self._outbox
+
+    @property
+    def calendar(self) -> "Calendar":
+        """The connected calendar, created on first use."""
+        if self._calendar is not None:
+            return self._calendar
+
+        from thallo.calendar import Calendar, Token
+
+        index = self.index
+        with self._lock:
+            if self._calendar is None:
+                token = Token(self.token_path, store=self.store())
+                self._calendar = Calendar(
+                    token=token, index=index, root_dir=self.root_dir
+                )
+            return self._calendar
+
+    def authorize(self, email: str = None):
+        """Fetch an OAuth2 token (requires a browser)."""
+        import thallo.auth
+
+        self.token_path.parent.mkdir(parents=True, exist_ok=True)
+        thallo.auth.run(
+            self.token_path, authorize=True, email=email, store=self.store()
+        )
+
+    def fetch(self, start: datetime, end: datetime, **kwargs) -> list[dict]:
+        """
+        Fetch calendar events between two given dates as dicts (see
+        `Calendar.extract_fields` for the schema).
+        """
+        return self.calendar.fetch_dict(start, end, **kwargs)
+
+    def fetch_events(self, start: datetime, end: datetime, **kwargs) -> list["Event"]:
+        """
+        Fetch calendar events between two given dates as `Event` objects.
+        """
+        return self.calendar.fetch(start, end, **kwargs)
+
+    def add(
+        self,
+        start: datetime,
+        end: datetime = None,
+        duration: timedelta = timedelta(hours=1),
+        title="New Meeting",
+        private=False,
+        location=None,
+        attendees=None,
+        body=None,
+        save=True,
+    ) -> "Event":
+        """
+        Create a new event, saving it to the calendar unless `save` is False.
+        """
+        ev = self.calendar.add_event(
+            start,
+            end or start + duration,
+            title=title,
+            private=private,
+            location=location,
+            attendees=attendees,
+            body=body,
+        )
+        if save:
+            ev.save()
+        return ev
+
+    def flush(self, force=False) -> dict | None:
+        """
+        Send the events queued in the outbox (see `Outbox.flush`). Nothing
+        is connected if the outbox has nothing to send.
+        """
+        if (self.outbox.waiting() if force else self.outbox.due()) == 0:
+            return {
+                "sent": 0,
+                "retry": 0,
+                "failed": 0,
+                "waiting": self.outbox.waiting(),
+            }
+        return self.outbox.flush(self.calendar, force=force)
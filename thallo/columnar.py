@@ -0,0 +1,193 @@
+"""
+Columnar export of events, as Parquet or Arrow IPC files that analytics tools
+can memory-map instead of parsing JSON. Needs the optional `pyarrow` package
+(`pip install thallo[columnar]`).
+
+Events are written in row groups as the pages arrive from the server, so the
+memory used is bounded by the row group size rather than by the number of
+events exported.
+"""
+
+import pathlib
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    raise Exception(
+        "Columnar export needs the `pyarrow` package (`pip install thallo[columnar]`)"
+    )
+
+FORMATS = ("parquet", "arrow")
+ROW_GROUP_SIZE = 10_000
+
+STRING = pa.dictionary(pa.int32(), pa.string())
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+PERSON = pa.struct([("name", STRING), ("address", STRING)])
+
+# the fields of a Graph location, with empty addresses and coordinates as null
+ADDRESS_FIELDS = ["street", "city", "state", "countryOrRegion", "postalCode"]
+COORDINATE_FIELDS = [
+    "latitude",
+    "longitude",
+    "accuracy",
+    "altitude",
+    "altitudeAccuracy",
+]
+ADDRESS = pa.struct([(f, STRING) for f in ADDRESS_FIELDS])
+COORDINATES = pa.struct([(f, pa.float64()) for f in COORDINATE_FIELDS])
+LOCATION = pa.struct(
+    [
+        ("displayName", STRING),
+        ("uniqueId", STRING),
+        ("locationType", STRING),
+        ("address", ADDRESS),
+        ("coordinates", COORDINATES),
+    ]
+)
+
+# the fields of `Calendar.extract_fields`
+SCHEMA = pa.schema(
+    [
+        ("name", STRING),
+        ("body", pa.string()),
+        ("attendees", pa.list_(PERSON)),
+        ("organizer", PERSON),
+        ("location", LOCATION),
+        ("start_time", TIMESTAMP),
+        ("end_time", TIMESTAMP),
+    ]
+)
+
+
+class Dictionary:
+    """
+    The values of a dictionary-encoded column. The dictionary only grows, so
+    that each batch of an Arrow file extends the dictionary of the batch
+    before it (Arrow files cannot replace a dictionary).
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, values: list) -> pa.DictionaryArray:
+        codes = []
+        for value in values:
+            if value is None:
+                codes.append(None)
+                continue
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            codes.append(code)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes, pa.int32()), pa.array(self.values, pa.string())
+        )
+
+
+class EventWriter:
+    """
+    Writes event dicts to a Parquet or Arrow file. Events are buffered until
+    `row_group_size` of them are waiting, and then written as one row group
+    (or record batch).
+    """
+
+    def __init__(
+        self, path: pathlib.Path, format="parquet", row_group_size=ROW_GROUP_SIZE
+    ):
+        if format not in FORMATS:
+            raise Exception(f"Unknown format `{format}`, must be one of {FORMATS}")
+
+        self.row_group_size = row_group_size
+        self.count = 0
+        self.pending = []
+        self.dictionaries = {}
+
+        if format == "parquet":
+            self.writer = pq.ParquetWriter(path, SCHEMA)
+        else:
+            options = ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self.writer = ipc.new_file(path, SCHEMA, options=options)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _encode(self, column: str, values: list) -> pa.DictionaryArray:
+        return self.dictionaries.setdefault(column, Dictionary()).encode(values)
+
+    def _struct(self, column: str, items: list, fields: list[str]) -> pa.StructArray:
+        children = [
+            self._encode(f"{column}.{f}", [(i or {}).get(f) for i in items])
+            for f in fields
+        ]
+        mask = pa.array([i is None for i in items], pa.bool_())
+        return pa.StructArray.from_arrays(children, names=fields, mask=mask)
+
+    def _location(self, items: list) -> pa.StructArray:
+        items = [i or None for i in items]
+        addresses = [(i or {}).get("address") or None for i in items]
+        coordinates = [(i or {}).get("coordinates") or None for i in items]
+        fields = ["displayName", "uniqueId", "locationType"]
+        children = [
+            self._encode(f"location.{f}", [(i or {}).get(f) for i in items])
+            for f in fields
+        ]
+        children.append(self._struct("location.address", addresses, ADDRESS_FIELDS))
+        children.append(
+            pa.StructArray.from_arrays(
+                [
+                    pa.array([(c or {}).get(f) for c in coordinates], pa.float64())
+                    for f in COORDINATE_FIELDS
+                ],
+                names=COORDINATE_FIELDS,
+                mask=pa.array([c is None for c in coordinates], pa.bool_()),
+            )
+        )
+        mask = pa.array([i is None for i in items], pa.bool_())
+        return pa.StructArray.from_arrays(
+            children, names=fields + ["address", "coordinates"], mask=mask
+        )
+
+    def _batch(self, events: list[dict]) -> pa.RecordBatch:
+        offsets = [0]
+        people = []
+        for e in events:
+            people += e["attendees"]
+            offsets.append(len(people))
+
+        columns = [
+            self._encode("name", [e["name"] for e in events]),
+            pa.array([e["body"] for e in events], pa.string()),
+            pa.ListArray.from_arrays(
+                pa.array(offsets, pa.int32()),
+                self._struct("attendees", people, ["name", "address"]),
+            ),
+            self._struct(
+                "organizer", [e["organizer"] for e in events], ["name", "address"]
+            ),
+            self._location([e["location"] for e in events]),
+            pa.array([e["start_time"] for e in events], TIMESTAMP),
+            pa.array([e["end_time"] for e in events], TIMESTAMP),
+        ]
+        return pa.record_batch(columns, schema=SCHEMA)
+
+    def write(self, events: list[dict]):
+        self.pending += events
+        if len(self.pending) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.writer.write_batch(self._batch(self.pending))
+            self.count += len(self.pending)
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
@@ -0,0 +1,145 @@
+"""
+Shell completion. Everything here is answered from the local index, opened
+read-only, so completing a command never needs the network, the token or gpg.
+Like `thallo.main`, this module must not import anything that pulls in O365,
+dateparser or markdownify.
+"""
+
+import sqlite3
+
+from datetime import datetime, timedelta
+
+import click
+
+from click.shell_completion import CompletionItem
+
+import thallo.utils as utils
+
+# the most completions offered at once
+LIMIT = 50
+
+DAY_WORDS = {"yesterday": -1, "today": 0, "tomorrow": 1}
+WEEKDAYS = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+DATE_FORMATS = ["%d/%m/%Y", "%d/%m/%y", "%Y-%m-%d"]
+
+
+def _connect(ctx: click.Context) -> sqlite3.Connection | None:
+    profile = ctx.find_root().params.get("profile")
+    path = utils.get_index_path(utils.get_root_dir(profile))
+    if not path.exists():
+        return None
+    return sqlite3.connect(path.as_uri() + "?mode=ro", uri=True)
+
+
+def _query(ctx: click.Context, sql: str, params=()) -> list[tuple]:
+    try:
+        db = _connect(ctx)
+        if db is None:
+            return []
+        try:
+            return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+    except sqlite3.Error:
+        return []
+
+
+def _like(text: str) -> str:
+    """A LIKE pattern matching strings that start with `text`."""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def quick_date(words) -> datetime | None:
+    """
+    Parse the simplest forms of date (day words, weekdays and numeric dates)
+    without dateparser. Anything else gives None.
+    """
+    today = utils.today()
+    text = " ".join(words or []).strip().lower()
+    if not text:
+        return today
+    if text in DAY_WORDS:
+        return today + timedelta(days=DAY_WORDS[text])
+    if text in WEEKDAYS:
+        return today + timedelta(days=(WEEKDAYS.index(text) - today.weekday()) % 7)
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    try:
+        return datetime.strptime(text, "%d/%m").replace(year=today.year)
+    except ValueError:
+        return None
+
+
+def _day_events(ctx: click.Context) -> list[tuple]:
+    """The `(name, start)` of the indexed events on the day being completed."""
+    # while completing an option, the dates before it are left unparsed
+    day = quick_date(ctx.params.get("dates") or ctx.args)
+    if day is None:
+        return []
+    return _query(
+        ctx,
+        "SELECT json_extract(data, '$.name'), start FROM events "
+        "WHERE start < ? AND end > ? ORDER BY start",
+        (day.timestamp() + 86400, day.timestamp()),
+    )
+
+
+def dates(ctx, param, incomplete: str) -> list[CompletionItem]:
+    today = utils.today()
+    days = [today + timedelta(days=i) for i in range(14)]
+    words = list(DAY_WORDS) + WEEKDAYS + [f"{d:%d/%m/%Y}" for d in days]
+    return [CompletionItem(w) for w in words if w.startswith(incomplete.lower())]
+
+
+def event_names(ctx, param, incomplete: str) -> list[CompletionItem]:
+    prefix = incomplete.lower()
+    names = dict.fromkeys(n for n, _ in _day_events(ctx) if n)
+    return [CompletionItem(n) for n in names if n.lower().startswith(prefix)]
+
+
+def event_indices(ctx, param, incomplete: str) -> list[CompletionItem]:
+    items = [
+        CompletionItem(str(i), help=name or "")
+        for i, (name, _) in enumerate(_day_events(ctx))
+    ]
+    return [i for i in items if i.value.startswith(incomplete)]
+
+
+def locations(ctx, param, incomplete: str) -> list[CompletionItem]:
+    rows = _query(
+        ctx,
+        "SELECT json_extract(data, '$.location.uniqueId') AS loc, count(*) AS n "
+        "FROM events WHERE loc LIKE ? ESCAPE '\\' AND loc != '' "
+        "GROUP BY loc ORDER BY n DESC LIMIT ?",
+        (_like(incomplete), LIMIT),
+    )
+    return [CompletionItem(loc) for loc, _ in rows]
+
+
+def invites(ctx, param, incomplete: str) -> list[CompletionItem]:
+    """Complete the last address of a comma separated list."""
+    head, _, last = incomplete.rpartition(",")
+    head = head + "," if head else ""
+    last = last.strip()
+    pattern = _like(last)
+    rows = _query(
+        ctx,
+        "SELECT address, name FROM people "
+        "WHERE address LIKE ?1 ESCAPE '\\' OR name LIKE ?1 ESCAPE '\\' "
+        "OR name LIKE '% ' || ?1 ESCAPE '\\' "
+        "ORDER BY count DESC, last_seen DESC LIMIT ?2",
+        (pattern, LIMIT),
+    )
+    return [CompletionItem(head + address, help=name or "") for address, name in rows]
@@ -0,0 +1,143 @@
+"""
+A directory of the people seen in fetched events, for completing and checking
+invitations offline. The people are kept in the local index, and looked up
+through prefix tries built when the directory is loaded.
+"""
+
+import time
+
+from thallo.index import EventIndex
+
+# the score of an appearance halves over this many days
+HALF_LIFE_DAYS = 90
+
+END = ""
+
+
+class Trie:
+    """Maps words to sets of values, with prefix and fuzzy lookup."""
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, word: str, value):
+        node = self.root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node.setdefault(END, set()).add(value)
+
+    def prefix(self, prefix: str) -> set:
+        """Every value stored under a word starting with `prefix`."""
+        node = self.root
+        for ch in prefix:
+            if ch not in node:
+                return set()
+            node = node[ch]
+
+        values = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key == END:
+                    values |= child
+                else:
+                    stack.append(child)
+        return values
+
+    def near(self, word: str, max_distance: int) -> dict:
+        """
+        Every value stored under a word within `max_distance` edits of
+        `word`, with its distance. Each trie node extends the edit distance
+        row of its parent, and branches are dropped as soon as no word below
+        them can be close enough.
+        """
+        found = {}
+        first = list(range(len(word) + 1))
+        stack = [(child, ch, first) for ch, child in self.root.items() if ch != END]
+        while stack:
+            node, ch, previous = stack.pop()
+            row = [previous[0] + 1]
+            for i, c in enumerate(word, 1):
+                row.append(
+                    min(row[i - 1] + 1, previous[i] + 1, previous[i - 1] + (c != ch))
+                )
+            if END in node and row[-1] <= max_distance:
+                for value in node[END]:
+                    found[value] = min(found.get(value, row[-1]), row[-1])
+            if min(row) <= max_distance:
+                stack += [(n, c, row) for c, n in node.items() if c != END]
+        return found
+
+
+class Directory:
+    """
+    The people in the index, ranked by how often and how recently they have
+    appeared in events.
+    """
+
+    def __init__(self, people: list[tuple], now: float = None):
+        now = now or time.time()
+        self.people = {}
+        self.scores = {}
+        self.names = Trie()
+        self.addresses = Trie()
+
+        for address, name, count, last_seen in people:
+            key = address.lower()
+            self.people[key] = {"address": address, "name": name}
+            age = max(0.0, now - last_seen) / 86400
+            self.scores[key] = count * 0.5 ** (age / HALF_LIFE_DAYS)
+
+            self.addresses.insert(key, key)
+            self.names.insert(key, key)
+            for word in (name or "").lower().split():
+                self.names.insert(word, key)
+            if name:
+                self.names.insert(name.lower(), key)
+
+    @classmethod
+    def from_index(cls, index: EventIndex) -> "Directory":
+        return cls(index.people())
+
+    def _ranked(self, keys) -> list[dict]:
+        keys = sorted(keys, key=lambda k: (-self.scores[k], k))
+        return [self.people[k] for k in keys]
+
+    def complete(self, text: str, limit=10) -> list[dict]:
+        """The best people whose name or address starts with `text`."""
+        text = text.strip().lower()
+        if not text:
+            return []
+        return self._ranked(self.names.prefix(text))[:limit]
+
+    def suggest(self, address: str, max_distance=2) -> list[dict]:
+        """Known addresses close to an unknown one, closest first."""
+        near = self.addresses.near(address.strip().lower(), max_distance)
+        keys = sorted(near, key=lambda k: (near[k], -self.scores[k], k))
+        return [self.people[k] for k in keys]
+
+    def resolve(self, entry: str) -> tuple[dict, str | None]:
+        """
+        Turn an invitation entry (an address, or the start of a name) into a
+        person, with the `name` the directory knows for them (or None) and
+        their `address`. Returns the person and a warning if the entry looks
+        wrong: an unknown address close to a known one, or a name no one
+        matches.
+        """
+        entry = entry.strip()
+        unknown = {"name": None, "address": entry}
+        if "@" in entry:
+            person = self.people.get(entry.lower())
+            if person:
+                return {"name": person["name"], "address": entry}, None
+            suggestions = self.suggest(entry)
+            if suggestions:
+                best = suggestions[0]["address"]
+                return unknown, f"{entry} is not in the directory, did you mean {best}?"
+            return unknown, None
+
+        matches = self.complete(entry, limit=1)
+        if not matches:
+            return unknown, f"No one matching `{entry}` in the directory."
+        return dict(matches[0]), None
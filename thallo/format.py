@@ -1,8 +1,12 @@
+import sys
+import copy
+import json
 import shutil
 import textwrap
+import functools
 from datetime import datetime
 
-from thallo.calendar import Event
+import click
 
 from colorama import init, Fore, Style
 
@@ -25,32 +29,47 @@ TIME_END = Fore.RESET + Style.RESET_ALL
 TITLE_FMT = Fore.CYAN + Style.BRIGHT
 TITLE_END = Fore.RESET + Style.RESET_ALL
 
-TERMINAL_WIDTH = shutil.get_terminal_size().columns
+DIM = Style.DIM
+DIM_END = Style.RESET_ALL
+
+# line prefixes of the box drawn around each event, assembled once
+BOX_TOP = " " + DIM + BOX_TOP_LEFT + DIM_END + " "
+BOX_MID = " " + DIM + BOX_CONT + DIM_END + " "
+BOX_BOT = " " + DIM + BOX_BOT_LEFT + DIM_END + " "
+
+LOCATION_LABEL = DIM + "Location: " + DIM_END
+BODY_LABEL = DIM + "Body:" + DIM_END
+ATTENDEES_LABEL = DIM + "Attendees:" + DIM_END
+
+TERMINAL_WIDTH, TERMINAL_HEIGHT = shutil.get_terminal_size()
+
+# write output to the terminal in chunks of about this many characters
+WRITE_CHUNK = 1 << 16
 
 
 def encapsulate(lines: list[str]) -> str:
-    buf = ""
-    for i, l in enumerate(lines):
-        buf += " " + Style.DIM
-        if i == 0:
-            buf += BOX_TOP_LEFT
-        elif i == len(lines) - 1:
-            buf += BOX_BOT_LEFT
-        else:
-            buf += BOX_CONT
-        buf += Style.RESET_ALL
+    last = len(lines) - 1
+    return "\n".join(
+        (BOX_TOP if i == 0 else BOX_BOT if i == last else BOX_MID) + l
+        for i, l in enumerate(lines)
+    )
+
 
-        buf += " " + l + "\n"
-    return buf[:-1]
+@functools.lru_cache()
+def _wrapper(width: int) -> textwrap.TextWrapper:
+    return textwrap.TextWrapper(width)
 
 
 def text_wrap(text: str, width=TERMINAL_WIDTH, indent=0) -> list[str]:
+    wrap = _wrapper(width).wrap
     lines = []
     for line in text.split("\n"):
         if len(line.strip()) == 0:
-            lines += [""]
+            lines.append("")
         else:
-            lines += textwrap.wrap(line, width)
+            lines.extend(wrap(line))
+    if indent == 0:
+        return lines
     _indent = " " * indent
     return [_indent + line for line in lines]
 
@@ -59,56 +78,42 @@ def str_date_local(date) -> str:
     return date.astimezone(current_tz).strftime("%a %b %d %Y")
 
 
-def pretty_print_info(
-    event: Event,
+def format_info(
+    event: dict,
     attendees=False,
     location=False,
     body=False,
     index=None,
     wrap=True,
-):
+) -> str:
+    """Render a single event as a boxed block of text."""
     start = event["start_time"].astimezone(current_tz)
-    start_date = start.strftime("%a %d %b %Y")
-    start_time = start.strftime("%H:%M")
-
     end = event["end_time"].astimezone(current_tz)
-    end_date = end.strftime("%a %d %b %Y")
-    end_time = end.strftime("%H:%M")
 
     lines = []
     if index is not None:
-        lines.append(Style.DIM + f"Event #{index}" + Style.RESET_ALL)
-
-    # print the time of the event
-    buf = ""
-    buf += Style.DIM + start_date + Style.RESET_ALL
-    buf += " "
-    buf += TIME_FMT + start_time + TIME_END
-    buf += " - "
-    buf += Style.DIM + end_date + Style.RESET_ALL
-    buf += " "
-    buf += TIME_FMT + end_time + TIME_END
-    lines.append(buf)
+        lines.append(f"{DIM}Event #{index}{DIM_END}")
+
+    # the time of the event
+    lines.append(
+        f"{DIM}{start:%a %d %b %Y}{DIM_END} {TIME_FMT}{start:%H:%M}{TIME_END}"
+        f" - {DIM}{end:%a %d %b %Y}{DIM_END} {TIME_FMT}{end:%H:%M}{TIME_END}"
+    )
 
     # title
-    buf = ""
-    buf += TITLE_FMT + event["name"] + TITLE_END
     n = len(event["attendees"])
-    buf += f" - with {n} attendees"
-    lines.append(buf)
+    lines.append(f"{TITLE_FMT}{event['name']}{TITLE_END} - with {n} attendees")
 
     # location details
     if location and event["location"]:
         loc = event["location"]
         loc_name = loc.get("displayName", loc.get("uniqueId", None))
         if loc_name:
-            buf = Style.DIM + "Location: " + Style.RESET_ALL
-            buf += loc_name
-            lines.append(buf)
+            lines.append(LOCATION_LABEL + loc_name)
 
     # body
     if body:
-        lines.append(Style.DIM + "Body:" + Style.RESET_ALL)
+        lines.append(BODY_LABEL)
         body = event["body"] or " - No body - "
         if wrap:
             lines += text_wrap(body, width=80, indent=1)
@@ -116,19 +121,46 @@ def pretty_print_info(
             lines += body.split("\n")
 
     if attendees and n > 0:
-        lines.append(Style.DIM + "Attendees:" + Style.RESET_ALL)
-        for att in event["attendees"]:
-            name = att["name"]
-            address = att["address"]
-            lines.append(f" - {name} {Style.DIM}<{address}>{Style.RESET_ALL}")
+        lines.append(ATTENDEES_LABEL)
+        lines += [
+            f" - {att['name']} {DIM}<{att['address']}>{DIM_END}"
+            for att in event["attendees"]
+        ]
+
+    return encapsulate(lines)
+
+
+def write_output(text: str, file=None):
+    """
+    Write a block of text to the terminal, through `$PAGER` if it is taller
+    than the screen, otherwise in large chunks.
+    """
+    file = file or sys.stdout
+    if file.isatty() and text.count("\n") >= TERMINAL_HEIGHT:
+        click.echo_via_pager(text)
+        return
+
+    for i in range(0, len(text), WRITE_CHUNK):
+        file.write(text[i : i + WRITE_CHUNK])
+    file.flush()
+
+
+def json_dump_events(events: list[dict]) -> str:
+    _events = copy.deepcopy(events)
+    for ev in _events:
+        ev["start_time"] = ev["start_time"].isoformat()
+        ev["end_time"] = ev["end_time"].isoformat()
+    return json.dumps(_events)
+
 
-    # newline
-    print(encapsulate(lines))
+def pretty_print_info(event: dict, **kwargs):
+    write_output(format_info(event, **kwargs) + "\n")
 
 
-def pretty_print_events(events: list[Event]):
-    # new line at the top
-    print()
+def pretty_print_events(events: list[dict], header=None, file=None):
+    parts = [header, ""] if header else [""]
     for i, event in enumerate(events):
-        pretty_print_info(event, index=i)
-        print("")
+        parts.append(format_info(event, index=i))
+        parts.append("")
+    parts.append("")
+    write_output("\n".join(parts), file=file)
@@ -0,0 +1,92 @@
+"""
+Serving events from the local index under a freshness policy, in the manner
+of HTTP's `max-age` and `stale-while-revalidate`:
+
+- events fetched at most `max_age` seconds ago are served from the index;
+- events up to `stale` seconds older than that are served from the index at
+  once, and fetched again in the background;
+- anything older (or never fetched) is fetched before it is served.
+"""
+
+import threading
+
+from collections import Counter
+from datetime import datetime
+
+from thallo.index import to_record
+
+FRESH = "fresh"
+STALE = "stale"
+EXPIRED = "expired"
+
+
+def lookup(index, start: datetime, end: datetime, max_age: float, stale: float):
+    """
+    The state of the cached events between two dates, their age in seconds,
+    and the events themselves (None unless fresh or stale).
+    """
+    age = index.age(start, end) if index is not None else None
+    if age is None or age > max_age + stale:
+        return EXPIRED, age, None
+    state = FRESH if age <= max_age else STALE
+    return state, age, index.events_between(start, end)
+
+
+def diff(old: list[dict], new: list[dict]) -> tuple[int, int]:
+    """The number of events added and removed (a change counts as both)."""
+    before = Counter(to_record(e) for e in old)
+    after = Counter(to_record(e) for e in new)
+    return sum((after - before).values()), sum((before - after).values())
+
+
+def describe_age(seconds: float) -> str:
+    minutes = round(seconds / 60)
+    if minutes < 1:
+        return "just now"
+    if minutes < 120:
+        return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
+    return f"{round(minutes / 60)} hours ago"
+
+
+def fetch(
+    client,
+    start: datetime,
+    end: datetime,
+    max_age=0.0,
+    stale=0.0,
+    on_change=None,
+    on_error=None,
+    **kwargs,
+) -> tuple[list[dict], float | None, threading.Thread | None]:
+    """
+    Fetch the events between two dates from `client` under the freshness
+    policy. Returns the events, their age (None if just fetched), and the
+    thread revalidating them (if any). When the revalidated events differ,
+    `on_change(added, removed, events)` is called from that thread. A failed
+    revalidation leaves the index as it was, and its exception is passed to
+    `on_error` (if given).
+
+    Serving from the index needs neither the token nor the network, as the
+    calendar of the client is only connected when something is fetched.
+    """
+    state, age, events = lookup(client.index, start, end, max_age, stale)
+    if state == EXPIRED:
+        return client.fetch(start, end, **kwargs), None, None
+    if state == FRESH:
+        return events, age, None
+
+    def revalidate():
+        # typically offline, which is when serving stale events matters most
+        try:
+            latest = client.fetch(start, end, **kwargs)
+        except Exception as e:
+            if on_error is not None:
+                on_error(e)
+            return
+        added, removed = diff(events, latest)
+        if (added or removed) and on_change is not None:
+            on_change(added, removed, latest)
+
+    thread = threading.Thread(target=revalidate, name="thallo-revalidate")
+    thread.start()
+    return events, age, thread
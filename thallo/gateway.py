@@ -0,0 +1,177 @@
+"""
+A local HTTP gateway serving events as JSON, so that many readers can share
+one warm session instead of each running `thallo fetch --json`:
+
+    GET /events?from=<date>&to=<date>
+
+returns the same JSON as `fetch --json`, with every event overlapping the
+range. Responses are cached for the refresh
+interval, identical queries arriving together share one upstream fetch, and
+every response has an `ETag`, so a reader that sends it back in
+`If-None-Match` gets an empty `304 Not Modified` while the events are
+unchanged.
+"""
+
+import json
+import time
+import hashlib
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import click
+
+import thallo.utils as utils
+
+from thallo.format import json_dump_events
+
+# the most date ranges kept in the cache
+MAX_ENTRIES = 128
+
+
+class Response:
+    def __init__(self, body: bytes, fetched: float):
+        self.body = body
+        self.fetched = fetched
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class Gateway:
+    """
+    Caches the JSON of the events between pairs of dates, fetching each range
+    from `client` at most once per `refresh` seconds however many readers ask
+    for it.
+    """
+
+    def __init__(self, client, refresh=60.0, max_entries=MAX_ENTRIES, **kwargs):
+        self.client = client
+        self.refresh = refresh
+        self.max_entries = max_entries
+        self.fetch_kwargs = kwargs
+
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.inflight = {}
+        self.upstream = 0
+
+    def _fetch(self, start, end) -> Response:
+        events = self.client.fetch(start, end, **self.fetch_kwargs)
+        with self.lock:
+            self.upstream += 1
+        return Response(json_dump_events(events).encode(), time.monotonic())
+
+    def get(self, start, end) -> Response:
+        """
+        The response for the events between two dates. Only the first of
+        several concurrent callers for an expired range fetches it, and the
+        others wait for its result. If the fetch fails, the last response is
+        served instead, if there is one.
+        """
+        key = (start.timestamp(), end.timestamp())
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached and time.monotonic() - cached.fetched < self.refresh:
+                self.cache.move_to_end(key)
+                return cached
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            response = self._fetch(start, end)
+        except Exception as e:
+            if cached is None:
+                future.set_exception(e)
+            else:
+                click.echo(f"Fetch failed, serving cached events: {e}", err=True)
+                future.set_result(cached)
+        else:
+            future.set_result(response)
+            with self.lock:
+                self.cache[key] = response
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.max_entries:
+                    self.cache.popitem(last=False)
+        finally:
+            with self.lock:
+                del self.inflight[key]
+        return future.result()
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # readers tend to arrive together, and the default backlog of 5 drops
+    # their connections
+    request_queue_size = 128
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "thallo-gateway"
+
+    def send_json(self, status: int, body: bytes, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status: int, message: str):
+        self.send_json(status, json.dumps({"error": message}).encode())
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/events":
+            return self.send_error_json(404, f"No such endpoint `{url.path}`")
+
+        query = parse_qs(url.query)
+        try:
+            start = utils.parse_start_of_day(query.get("from", ["today"])[0].split())
+            end = utils.parse_start_of_day(query.get("to", ["tomorrow"])[0].split())
+        except Exception:
+            start = end = None
+        if start is None or end is None:
+            return self.send_error_json(400, "Could not parse `from` or `to`")
+
+        gateway = self.server.gateway
+        try:
+            response = gateway.get(start, end)
+        except Exception as e:
+            return self.send_error_json(502, f"Could not fetch events: {e}")
+
+        remaining = gateway.refresh - (time.monotonic() - response.fetched)
+        headers = {
+            "ETag": response.etag,
+            "Cache-Control": f"max-age={max(0, int(remaining))}",
+        }
+        matches = [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]
+        if response.etag in matches or "*" in matches:
+            self.send_response(304)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            return
+        self.send_json(200, response.body, headers)
+
+
+def serve(gateway: Gateway, host="127.0.0.1", port=8808, quiet=False):
+    """Serve a gateway until interrupted."""
+    handler = Handler
+    if quiet:
+        handler = type("QuietHandler", (Handler,), {"log_message": lambda *_: None})
+
+    server = Server((host, port), handler)
+    server.gateway = gateway
+    click.echo(f"Serving events on http://{host}:{server.server_port}/events", err=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,273 @@
+"""
+A local SQLite index of every event that has been fetched, with an FTS5
+full-text index over the subject, body, location and attendees.
+"""
+
+import json
+import time
+import sqlite3
+import pathlib
+import threading
+
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT UNIQUE NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_start ON events (start);
+-- disjoint ranges of time, and when the events in each were last fetched
+CREATE TABLE IF NOT EXISTS ranges (
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    fetched_at REAL NOT NULL
+);
+-- everyone seen as an attendee or organizer, for the attendee directory
+CREATE TABLE IF NOT EXISTS people (
+    address TEXT PRIMARY KEY COLLATE NOCASE,
+    name TEXT,
+    count INTEGER NOT NULL,
+    last_seen REAL NOT NULL
+);
+-- rows share their rowid with the events table
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5 (
+    name,
+    body,
+    location,
+    attendees,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# relative weights of the name, body, location and attendee columns when
+# ranking search results
+RANK_WEIGHTS = (10.0, 1.0, 2.0, 4.0)
+
+
+def to_record(event: dict) -> str:
+    e = dict(event)
+    e["start_time"] = e["start_time"].isoformat()
+    e["end_time"] = e["end_time"].isoformat()
+    return json.dumps(e, sort_keys=True)
+
+
+def from_record(data: str) -> dict:
+    e = json.loads(data)
+    e["start_time"] = datetime.fromisoformat(e["start_time"])
+    e["end_time"] = datetime.fromisoformat(e["end_time"])
+    return e
+
+
+def _people(event: dict) -> list[dict]:
+    people = list(event["attendees"])
+    if event.get("organizer"):
+        people.append(event["organizer"])
+    return [p for p in people if p.get("address")]
+
+
+def _search_text(event: dict) -> tuple:
+    loc = event["location"] or {}
+    location = loc.get("displayName", loc.get("uniqueId", "")) or ""
+    attendees = " ".join(f"{i['name']} {i['address']}" for i in event["attendees"])
+    return (event["name"] or "", event["body"] or "", location, attendees)
+
+
+def make_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 query, where every word must match as a
+    prefix. Words are quoted so that punctuation is never read as syntax.
+    """
+    words = [w.replace('"', '""') for w in text.split()]
+    return " ".join(f'"{w}"*' for w in words)
+
+
+class EventIndex:
+    def __init__(self, path: pathlib.Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        # the gateway's request threads and the revalidating thread of
+        # `thallo.fresh` share this connection, one statement at a time
+        self.lock = threading.RLock()
+        self._fill_people()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, start: datetime, end: datetime, events: list):
+        """
+        Bring the index up to date with the result of fetching the events
+        between two dates. `events` is a list of `(id, event_dict)` pairs.
+        Unchanged events are left alone, and indexed events in the range that
+        were not returned are removed.
+        """
+        s, e = start.timestamp(), end.timestamp()
+        with self.lock, self.db:
+            existing = dict(
+                self.db.execute(
+                    "SELECT id, data FROM events WHERE start < ? AND end > ?",
+                    (e, s),
+                )
+            )
+            fetched = set()
+            for event_id, event in events:
+                if event_id is None:
+                    continue
+                fetched.add(event_id)
+                data = to_record(event)
+                if existing.get(event_id) == data:
+                    continue
+                self._put(event_id, event, data)
+
+            for event_id in set(existing) - fetched:
+                self._delete(event_id)
+
+            self._record_range(s, e, time.time())
+
+    def _record_range(self, s: float, e: float, fetched_at: float):
+        """Mark a range as fetched, trimming older ranges that overlap it."""
+        older = self.db.execute(
+            "SELECT rowid, start, end, fetched_at FROM ranges "
+            "WHERE start < ? AND end > ?",
+            (e, s),
+        ).fetchall()
+        for rowid, r_start, r_end, r_fetched_at in older:
+            self.db.execute("DELETE FROM ranges WHERE rowid = ?", (rowid,))
+            for piece in ((r_start, s), (e, r_end)):
+                if piece[0] < piece[1]:
+                    self.db.execute(
+                        "INSERT INTO ranges (start, end, fetched_at) VALUES (?, ?, ?)",
+                        (*piece, r_fetched_at),
+                    )
+        self.db.execute(
+            "INSERT INTO ranges (start, end, fetched_at) VALUES (?, ?, ?)",
+            (s, e, fetched_at),
+        )
+
+    def age(self, start: datetime, end: datetime) -> float | None:
+        """
+        How many seconds ago the events between two dates were fetched (the
+        oldest part of the range counts), or None if some of the range has
+        never been fetched.
+        """
+        s, e = start.timestamp(), end.timestamp()
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT start, end, fetched_at FROM ranges "
+                "WHERE start < ? AND end > ? ORDER BY start",
+                (e, s),
+            ).fetchall()
+
+        covered = s
+        oldest = None
+        for r_start, r_end, fetched_at in rows:
+            if r_start > covered:
+                return None
+            covered = max(covered, r_end)
+            oldest = fetched_at if oldest is None else min(oldest, fetched_at)
+        if covered < e or oldest is None:
+            return None
+        return time.time() - oldest
+
+    def put(self, event_id: str, event: dict):
+        """Add or replace a single event."""
+        with self.lock, self.db:
+            self._put(event_id, event, to_record(event))
+
+    def remove(self, event_id: str):
+        """Remove a single event, if it is indexed."""
+        with self.lock, self.db:
+            self._delete(event_id)
+
+    def _put(self, event_id: str, event: dict, data: str):
+        if not self._delete(event_id):
+            self._see_people(event)
+        cursor = self.db.execute(
+            "INSERT INTO events (id, start, end, data) VALUES (?, ?, ?, ?)",
+            (
+                event_id,
+                event["start_time"].timestamp(),
+                event["end_time"].timestamp(),
+                data,
+            ),
+        )
+        self.db.execute(
+            "INSERT INTO events_fts (rowid, name, body, location, attendees) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (cursor.lastrowid, *_search_text(event)),
+        )
+
+    def _delete(self, event_id: str):
+        row = self.db.execute(
+            "SELECT rowid FROM events WHERE id = ?", (event_id,)
+        ).fetchone()
+        if row:
+            self.db.execute("DELETE FROM events WHERE rowid = ?", row)
+            self.db.execute("DELETE FROM events_fts WHERE rowid = ?", row)
+        return row is not None
+
+    def _see_people(self, event: dict):
+        """Count one appearance of everyone in an event."""
+        seen = event["start_time"].timestamp()
+        self.db.executemany(
+            "INSERT INTO people (address, name, count, last_seen) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT (address) DO UPDATE SET count = count + 1, "
+            "name = coalesce(excluded.name, name), "
+            "last_seen = max(last_seen, excluded.last_seen)",
+            [(p["address"], p.get("name") or None, seen) for p in _people(event)],
+        )
+
+    def _fill_people(self):
+        """Fill the directory from events indexed before it existed."""
+        with self.lock, self.db:
+            if self.db.execute("SELECT 1 FROM people LIMIT 1").fetchone():
+                return
+            for (data,) in self.db.execute("SELECT data FROM events").fetchall():
+                self._see_people(from_record(data))
+
+    def people(self) -> list[tuple]:
+        """Everyone in the directory, as `(address, name, count, last_seen)`."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT address, name, count, last_seen FROM people"
+            ).fetchall()
+
+    def search(
+        self, text: str, limit=20, start: datetime = None, end: datetime = None
+    ) -> list[dict]:
+        """Return the best matching events for some free text, best first."""
+        query = make_query(text)
+        if not query:
+            return []
+
+        sql = (
+            "SELECT e.data FROM events_fts JOIN events e ON e.rowid = events_fts.rowid "
+            "WHERE events_fts MATCH ?"
+        )
+        params = [query]
+        if start is not None:
+            sql += " AND e.end > ?"
+            params.append(start.timestamp())
+        if end is not None:
+            sql += " AND e.start < ?"
+            params.append(end.timestamp())
+        sql += " ORDER BY bm25(events_fts, ?, ?, ?, ?) LIMIT ?"
+        params += [*RANK_WEIGHTS, limit]
+
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        return [from_record(row[0]) for row in rows]
+
+    def events_between(self, start: datetime, end: datetime) -> list[dict]:
+        """Return the indexed events overlapping a range, sorted by start."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT data FROM events WHERE start < ? AND end > ? ORDER BY start",
+                (end.timestamp(), start.timestamp()),
+            ).fetchall()
+        return [from_record(row[0]) for row in rows]
@@ -1,54 +1,257 @@
+import os
+import sys
 import json
-import copy
+import typing
+import subprocess
 
 from datetime import datetime, timedelta
 
 import click
 
-import thallo.auth
+import thallo.complete as complete
+import thallo.fresh as fresh
 import thallo.utils as utils
 
-from thallo.format import pretty_print_events, pretty_print_info, str_date_local
-from thallo.calendar import Calendar, Event
-
+from thallo.client import Client
+from thallo.directory import Directory
+from thallo.format import (
+    json_dump_events,
+    pretty_print_events,
+    pretty_print_info,
+    str_date_local,
+)
 
-def get_calendar(calendar=[]) -> Calendar:
-    if len(calendar) > 0:
-        return calendar[0]
-    else:
-        calendar.append(Calendar())
-        return calendar[0]
+# modules that pull in O365 are imported by the commands that need them, so
+# that shell completion does not have to load them
+if typing.TYPE_CHECKING:
+    from thallo.calendar import Calendar
+
+
+def get_client() -> Client:
+    """The client of the current command, made by the `entry` group."""
+    return click.get_current_context().find_object(Client)
+
+
+def get_calendar() -> "Calendar":
+    return get_client().calendar
+
+
+def freshness(command: str, kwargs: dict) -> tuple[float, float]:
+    """
+    The `--max-age` and `--stale` limits of a command in seconds, defaulting
+    to `max_age` and `stale` in the command's section of the configuration
+    file, and else to always fetching.
+    """
+    config_path = get_client().config_path
+    limits = []
+    for key in ("max_age", "stale"):
+        value = kwargs[key] or utils.get_config_value(key, "0s", config_path, command)
+        limits.append(utils.parse_delta(value).total_seconds())
+    return tuple(limits)
+
+
+def run_detached(*command: str):
+    """
+    Run a thallo command in a process of its own, which carries on after
+    this one exits. The profile and cassette of this command are passed on,
+    and so is a token key given by file descriptor.
+    """
+    import thallo.store
+
+    root = click.get_current_context().find_root().params
+    args = [sys.executable, "-m", "thallo"]
+    if root["profile"]:
+        args += ["--profile", root["profile"]]
+    if root["record"]:
+        args += ["--record", root["record"]]
+    if root["replay"]:
+        args += ["--replay", root["replay"]]
+
+    key_env, key_fds = thallo.store.child_key_fds()
+    try:
+        subprocess.Popen(
+            args + list(command),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            env=dict(os.environ, **key_env),
+            pass_fds=key_fds,
+        )
+    finally:
+        for fd in key_fds:
+            os.close(fd)
+
+
+def refresh_detached(start: datetime, end: datetime, kwargs: dict):
+    """Fetch a range again in a process of its own, to update the index."""
+    args = ["fetch", "--from", f"{start:%d/%m/%Y}", "--to", f"{end:%d/%m/%Y}"]
+    args += ["--page-size", str(kwargs["page_size"]), "--json"]
+    # always go upstream, whatever the configured freshness policy
+    args += ["--max-age", "0s", "--stale", "0s"]
+    if kwargs["local_recurrence"]:
+        args.append("--local-recurrence")
+    run_detached(*args)
+
+
+def fetch_events(command: str, start: datetime, end: datetime, kwargs: dict):
+    """
+    Fetch the events between two dates for a command, following its
+    freshness policy (see `thallo.fresh`). Notices about cached events go to
+    stderr, so that they do not mix with JSON output.
+    """
+    max_age, stale = freshness(command, kwargs)
+    fetch_kwargs = dict(
+        local_recurrence=kwargs["local_recurrence"], page_size=kwargs["page_size"]
+    )
 
+    if kwargs["detach"]:
+        state, age, events = fresh.lookup(
+            get_client().index, start, end, max_age, stale
+        )
+        if state == fresh.EXPIRED:
+            return get_client().fetch(start, end, **fetch_kwargs)
+        if state == fresh.STALE:
+            refresh_detached(start, end, kwargs)
+            click.echo(
+                f"Showing events cached {fresh.describe_age(age)}, "
+                "refreshing in the background.",
+                err=True,
+            )
+        return events
+
+    def on_change(added, removed, _):
+        click.echo(
+            f"The calendar has changed since: {added} new or updated, "
+            f"{removed} removed or updated. Run again to see the changes.",
+            err=True,
+        )
+
+    def on_error(e):
+        click.echo(f"Could not refresh the cached events: {e}", err=True)
+
+    events, age, thread = fresh.fetch(
+        get_client(),
+        start,
+        end,
+        max_age=max_age,
+        stale=stale,
+        on_change=on_change,
+        on_error=on_error,
+        **fetch_kwargs,
+    )
+    if thread is not None:
+        click.echo(f"Showing events cached {fresh.describe_age(age)}.", err=True)
+        # the process waits for the refresh to finish once the events have
+        # been printed
+        click.get_current_context().call_on_close(thread.join)
+    return events
+
+
+def export_events(start: datetime, end: datetime, kwargs: dict):
+    """
+    Write the events between two dates to a columnar file (see
+    `thallo.columnar`) page by page, without holding them all in memory.
+    """
+    from thallo.calendar import Calendar
+    from thallo.columnar import EventWriter
 
-def get_calendar_dates(dates: list[str], delta_days=1) -> Calendar:
-    date = utils.parse_start_of_day(dates)
     calendar = get_calendar()
-    return date, calendar.fetch_dict(date, date + timedelta(days=delta_days))
-
-
-def json_dump_events(events: list[Event]) -> str:
-    _events = copy.deepcopy(events)
-    for ev in _events:
-        ev["start_time"] = ev["start_time"].isoformat()
-        ev["end_time"] = ev["end_time"].isoformat()
-    return json.dumps(_events)
+    if kwargs["local_recurrence"]:
+        pages = [calendar.fetch_local_recurrence(start, end)]
+    else:
+        pages = calendar.iter_pages(start, end, page_size=kwargs["page_size"])
+
+    path = kwargs["output"] or f"events.{kwargs['format']}"
+    with EventWriter(path, kwargs["format"]) as writer:
+        for page in pages:
+            writer.write([Calendar.extract_fields(e) for e in page])
+    print(f"Wrote {writer.count} events to {path}")
+
+
+def resolve_invites(entries: list[str]) -> tuple[list[dict], bool]:
+    """
+    Resolve invitation entries (addresses, or the start of names) through the
+    attendee directory, printing completed names and suspicious addresses.
+    Returns the people, with their names where known, and whether they all
+    look right.
+    """
+    index = get_client().index
+    directory = Directory.from_index(index) if index is not None else Directory([])
+
+    people = []
+    ok = True
+    for entry in (i.strip() for i in entries):
+        if not entry:
+            continue
+        person, warning = directory.resolve(entry)
+        if warning:
+            print(f"Warning: {warning}")
+            ok = False
+        elif person["address"] != entry:
+            print(f"Inviting {person['name']} <{person['address']}> for `{entry}`")
+        people.append(person)
+    return people, ok
 
 
 @click.group()
-def entry():
+@click.option(
+    "--profile",
+    help="Use the token, configuration and caches of a named profile.",
+)
+@click.option(
+    "--record",
+    type=click.Path(file_okay=False),
+    help="Record HTTP exchanges (tokens redacted) as cassettes in this directory.",
+)
+@click.option(
+    "--replay",
+    type=click.Path(exists=True, file_okay=False),
+    help="Serve HTTP exchanges from cassettes in this directory, without network or gpg.",
+)
+@click.pass_context
+def entry(ctx, profile, record, replay):
     """Thallo is a tool for interacting with Outlook calendars."""
-    pass
+    if record and replay:
+        raise click.UsageError("Can only specify one of `--record` or `--replay`")
+
+    ctx.obj = Client(profile=profile)
+    ctx.call_on_close(ctx.obj.close)
+
+    if record or replay:
+        import thallo.cassette
+
+    if record:
+        thallo.cassette.use(thallo.cassette.Cassette(record, mode="record"))
+    elif replay:
+        thallo.cassette.use(thallo.cassette.Cassette(replay, mode="replay"))
+
+
+@entry.result_callback()
+@click.pass_context
+def flush_after(ctx, *_, **__):
+    """
+    Send anything an earlier `add` left in the outbox once a command has run.
+    Only called after a subcommand completes, so never for `--help` or shell
+    completion.
+    """
+    if ctx.invoked_subcommand in ("add", "flush"):
+        return
+    if utils.get_outbox_path(ctx.obj.root_dir).exists() and ctx.obj.outbox.due():
+        run_detached("flush", "--background")
 
 
 @click.command()
 @click.option(
     "--from",
+    shell_complete=complete.dates,
     default="today",
     show_default=True,
     help="The date to select from",
 )
 @click.option(
     "--to",
+    shell_complete=complete.dates,
     default="tomorrow",
     show_default=True,
     help="The date to select to, not inclusive (defaults to a fortnight ahead).",
@@ -58,34 +261,76 @@ def entry():
     is_flag=True,
     help="Output the fetched events as a JSON string.",
 )
+@click.option(
+    "--local-recurrence",
+    is_flag=True,
+    help="Expand recurring events locally from cached series instead of on the server.",
+)
+@click.option(
+    "--page-size",
+    default=100,
+    type=click.IntRange(1, 1000),
+    show_default=True,
+    help="Number of events to request from the server at once.",
+)
+@click.option(
+    "--max-age",
+    help="Serve events fetched at most this long ago from the local index.",
+)
+@click.option(
+    "--stale",
+    help="Serve events this much older than `--max-age` from the local index, and refresh them in the background.",
+)
+@click.option(
+    "--detach",
+    is_flag=True,
+    help="Refresh stale events in a detached process instead of waiting for it.",
+)
+@click.option(
+    "--format",
+    type=click.Choice(["parquet", "arrow"]),
+    help="Write the events to a columnar file instead of printing them.",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False),
+    help="The file to write with `--format` (defaults to `events.<format>`).",
+)
 def fetch(**kwargs):
     """Fetch events from the calendar and print in various ways."""
     start = utils.parse_start_of_day(kwargs["from"].split())
     end = utils.parse_start_of_day(kwargs["to"].split())
 
-    calendar = get_calendar()
-    events = calendar.fetch_dict(start, end)
+    if kwargs["format"]:
+        export_events(start, end, kwargs)
+        return
+
+    events = fetch_events("fetch", start, end, kwargs)
 
-    print(f"Events from {str_date_local(start)} to {str_date_local(end)}")
+    header = f"Events from {str_date_local(start)} to {str_date_local(end)}"
 
     if kwargs["json"]:
+        print(header)
         print(json_dump_events(events))
         return
 
-    pretty_print_events(events)
+    pretty_print_events(events, header=header)
 
 
 @click.command()
-@click.argument("dates", nargs=-1)
+@click.argument("dates", nargs=-1, shell_complete=complete.dates)
 @click.option(
     "-i",
     "--index",
+    shell_complete=complete.event_indices,
     type=int,
     help="The index of the event on the selected day.",
 )
 @click.option(
     "-n",
     "--name",
+    shell_complete=complete.event_names,
     type=str,
     help="The name of the event on the selected day.",
 )
@@ -94,9 +339,35 @@ def fetch(**kwargs):
     is_flag=True,
     help="Output the events as a JSON string.",
 )
+@click.option(
+    "--local-recurrence",
+    is_flag=True,
+    help="Expand recurring events locally from cached series instead of on the server.",
+)
+@click.option(
+    "--page-size",
+    default=100,
+    type=click.IntRange(1, 1000),
+    show_default=True,
+    help="Number of events to request from the server at once.",
+)
+@click.option(
+    "--max-age",
+    help="Serve events fetched at most this long ago from the local index.",
+)
+@click.option(
+    "--stale",
+    help="Serve events this much older than `--max-age` from the local index, and refresh them in the background.",
+)
+@click.option(
+    "--detach",
+    is_flag=True,
+    help="Refresh stale events in a detached process instead of waiting for it.",
+)
 def info(dates, **kwargs):
     """Get detailed information about a day or specific event."""
-    parsed_date, events = get_calendar_dates(dates)
+    parsed_date = utils.parse_start_of_day(dates)
+    events = fetch_events("info", parsed_date, parsed_date + timedelta(days=1), kwargs)
 
     print(f"Events for {str_date_local(parsed_date)}")
 
@@ -134,7 +405,304 @@ def info(dates, **kwargs):
 
 
 @click.command()
-@click.argument("dates", nargs=-1)
+@click.argument("query", nargs=-1, required=True)
+@click.option(
+    "--from",
+    shell_complete=complete.dates,
+    help="Only search events after this date.",
+)
+@click.option(
+    "--to",
+    shell_complete=complete.dates,
+    help="Only search events before this date.",
+)
+@click.option(
+    "-l",
+    "--limit",
+    default=20,
+    type=int,
+    show_default=True,
+    help="The maximum number of results.",
+)
+@click.option(
+    "--json",
+    is_flag=True,
+    help="Output the matching events as a JSON string.",
+)
+def search(query, **kwargs):
+    """Search the subject, body, location and attendees of fetched events."""
+    start = utils.parse_start_of_day(kwargs["from"].split()) if kwargs["from"] else None
+    end = utils.parse_start_of_day(kwargs["to"].split()) if kwargs["to"] else None
+
+    events = get_client().index.search(
+        " ".join(query), limit=kwargs["limit"], start=start, end=end
+    )
+
+    if kwargs["json"]:
+        return print(json_dump_events(events))
+
+    if len(events) == 0:
+        print("\n - No matching events - \n")
+        return
+
+    pretty_print_events(events)
+
+
+@click.command()
+@click.option(
+    "--from",
+    shell_complete=complete.dates,
+    help="Watch a fixed window from this date (with `--to`).",
+)
+@click.option(
+    "--to",
+    shell_complete=complete.dates,
+    help="Watch a fixed window to this date (with `--from`).",
+)
+@click.option(
+    "--days",
+    default=14,
+    type=int,
+    show_default=True,
+    help="Days ahead of today to watch, if no fixed window is given.",
+)
+@click.option(
+    "--min-interval",
+    default="15s",
+    show_default=True,
+    help="Shortest time between polls, used while the calendar is busy.",
+)
+@click.option(
+    "--max-interval",
+    default="10m",
+    show_default=True,
+    help="Longest time between polls, reached while the calendar is quiet.",
+)
+@click.option(
+    "--changes-only",
+    is_flag=True,
+    help="Do not report the events already present when watching starts.",
+)
+def watch(**kwargs):
+    """Stream added, updated and removed events as JSON Lines."""
+    import thallo.watch
+
+    start = end = None
+    if kwargs["from"] or kwargs["to"]:
+        if not (kwargs["from"] and kwargs["to"]):
+            raise click.UsageError("`--from` and `--to` must be given together")
+        start = utils.parse_start_of_day(kwargs["from"].split())
+        end = utils.parse_start_of_day(kwargs["to"].split())
+
+    def emit(change):
+        print(json.dumps(change), flush=True)
+
+    def warn(e):
+        click.echo(f"Polling failed, backing off: {e}", err=True)
+
+    watcher = thallo.watch.Watcher(
+        get_calendar(),
+        emit,
+        start=start,
+        end=end,
+        days=kwargs["days"],
+        min_interval=utils.parse_delta(kwargs["min_interval"]).total_seconds(),
+        max_interval=utils.parse_delta(kwargs["max_interval"]).total_seconds(),
+        initial=not kwargs["changes_only"],
+    )
+    try:
+        watcher.run(on_error=warn)
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command()
+@click.option(
+    "--before",
+    default="5m",
+    show_default=True,
+    help="How long before the start of an event to remind.",
+)
+@click.option(
+    "--exec",
+    "command",
+    help="Shell command to run for each reminder (see the README for its environment).",
+)
+@click.option(
+    "--days",
+    default=1,
+    type=int,
+    show_default=True,
+    help="Days ahead of today to load events for.",
+)
+@click.option(
+    "--min-refresh",
+    default="1m",
+    show_default=True,
+    help="Shortest time between checks for changes, used while the calendar is busy.",
+)
+@click.option(
+    "--max-refresh",
+    default="15m",
+    show_default=True,
+    help="Longest time between checks for changes, reached while the calendar is quiet.",
+)
+def remind(**kwargs):
+    """Run hooks shortly before events start."""
+    import thallo.remind
+
+    hook = thallo.remind.print_hook
+    if kwargs["command"]:
+        hook = thallo.remind.command_hook(kwargs["command"])
+
+    def warn(e):
+        click.echo(f"Refresh failed, backing off: {e}", err=True)
+
+    reminder = thallo.remind.Reminder(
+        get_calendar(),
+        hook=hook,
+        before=utils.parse_delta(kwargs["before"]),
+        days=kwargs["days"],
+        min_refresh=utils.parse_delta(kwargs["min_refresh"]).total_seconds(),
+        max_refresh=utils.parse_delta(kwargs["max_refresh"]).total_seconds(),
+    )
+    try:
+        reminder.run(on_error=warn)
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command()
+@click.option(
+    "--from",
+    shell_complete=complete.dates,
+    default="4 weeks ago",
+    show_default=True,
+    help="The date to select from.",
+)
+@click.option(
+    "--to",
+    shell_complete=complete.dates,
+    default="tomorrow",
+    show_default=True,
+    help="The date to select to, not inclusive.",
+)
+@click.option(
+    "--cached",
+    is_flag=True,
+    help="Use the events in the local index instead of fetching them.",
+)
+@click.option(
+    "--work-hours",
+    default="9-17",
+    show_default=True,
+    help="Working hours, used to find focus time.",
+)
+@click.option(
+    "--focus",
+    default="2h",
+    show_default=True,
+    help="The shortest free stretch that counts as focus time.",
+)
+@click.option(
+    "--gap",
+    default="5m",
+    show_default=True,
+    help="The longest break between meetings that are still back-to-back.",
+)
+@click.option(
+    "--json",
+    is_flag=True,
+    help="Output the statistics as a JSON string.",
+)
+def stats(**kwargs):
+    """Summarise the meeting load over a range of dates."""
+    import thallo.stats
+
+    start = utils.parse_start_of_day(kwargs["from"].split())
+    end = utils.parse_start_of_day(kwargs["to"].split())
+    work_hours = tuple(int(i) for i in kwargs["work_hours"].split("-"))
+
+    if kwargs["cached"]:
+        events = get_client().index.events_between(start, end)
+    else:
+        events = get_calendar().fetch_dict(start, end, sort=False)
+
+    summary = thallo.stats.summarize(
+        thallo.stats.EventArrays.from_events(events),
+        start,
+        end,
+        work_hours=work_hours,
+        min_focus=utils.parse_delta(kwargs["focus"]),
+        slack=utils.parse_delta(kwargs["gap"]),
+    )
+
+    if kwargs["json"]:
+        return print(json.dumps(summary))
+
+    print()
+    print(thallo.stats.format_summary(summary))
+    print()
+
+
+@click.command()
+@click.option(
+    "--host",
+    default="127.0.0.1",
+    show_default=True,
+    help="The address to listen on.",
+)
+@click.option(
+    "--port",
+    default=8808,
+    type=int,
+    show_default=True,
+    help="The port to listen on.",
+)
+@click.option(
+    "--refresh",
+    default="1m",
+    show_default=True,
+    help="How long a fetched range is served before it is fetched again.",
+)
+@click.option(
+    "--local-recurrence",
+    is_flag=True,
+    help="Expand recurring events locally from cached series instead of on the server.",
+)
+@click.option(
+    "--page-size",
+    default=100,
+    type=click.IntRange(1, 1000),
+    show_default=True,
+    help="Number of events to request from the server at once.",
+)
+@click.option(
+    "-q",
+    "--quiet",
+    is_flag=True,
+    help="Do not log each request.",
+)
+def gateway(**kwargs):
+    """Serve events as JSON over HTTP to local readers."""
+    import thallo.gateway
+
+    # connect before listening, so that token problems show at once
+    get_calendar()
+    gw = thallo.gateway.Gateway(
+        get_client(),
+        refresh=utils.parse_delta(kwargs["refresh"]).total_seconds(),
+        local_recurrence=kwargs["local_recurrence"],
+        page_size=kwargs["page_size"],
+    )
+    try:
+        thallo.gateway.serve(gw, kwargs["host"], kwargs["port"], kwargs["quiet"])
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command()
+@click.argument("dates", nargs=-1, shell_complete=complete.dates)
 @click.option(
     "-t",
     "--title",
@@ -168,16 +736,25 @@ def info(dates, **kwargs):
 )
 @click.option(
     "--location",
+    shell_complete=complete.locations,
     type=str,
     help="The location of the event (specify by `uniqueId`).",
 )
 @click.option(
     "--invite",
+    shell_complete=complete.invites,
     type=str,
-    help="A comma seperated list of email addresses to invite to the event.",
+    help="A comma seperated list of email addresses, or names from the attendee directory, to invite to the event.",
+)
+@click.option(
+    "--wait",
+    is_flag=True,
+    help="Send the event before returning, instead of in the background.",
 )
 def add(dates, **kwargs):
     """Add a new event to a calendar."""
+    from thallo.calendar import Calendar, Attendee
+
     date = " ".join(dates)
 
     start = date if date is click.DateTime else utils.parse_date(date)
@@ -190,10 +767,15 @@ def add(dates, **kwargs):
 
     invites = []
     if kwargs["invite"]:
-        invites += kwargs["invite"].split(",")
-
-    calendar = get_calendar()
-    ev = calendar.add_event(
+        invites, ok = resolve_invites(kwargs["invite"].split(","))
+        # the interactive editor gives a chance to fix them below
+        if not ok and not kwargs["interactive"]:
+            raise click.ClickException(
+                "Some invitations look wrong (see the warnings above). Fix "
+                "`--invite`, or use `-i` to edit the event."
+            )
+
+    ev = Calendar.draft_event(
         start,
         end,
         title=kwargs["title"],
@@ -204,15 +786,25 @@ def add(dates, **kwargs):
     )
 
     if kwargs["interactive"]:
-        contents = calendar.serialize_event(ev)
+        contents = Calendar.serialize_event(ev)
 
         while True:
             updated_contents = utils.tmp_editor(contents)
-            ev = calendar.deserialize_event(updated_contents)
+            ev = Calendar.deserialize_event(updated_contents)
             if not ev:
                 inp = input("Input invalid. Try again? [Y/n] ").strip().lower()
                 if inp == "" or inp == "y":
                     continue
+                break
+
+            people, ok = resolve_invites([i.address for i in ev.attendees])
+            ev.attendees.clear()
+            ev.attendees.add([Attendee(p["address"], name=p["name"]) for p in people])
+            if not ok:
+                inp = input("Edit again? [Y/n] ").strip().lower()
+                if inp == "" or inp == "y":
+                    contents = updated_contents
+                    continue
             break
 
     if not ev:
@@ -230,11 +822,85 @@ def add(dates, **kwargs):
     print()
 
     inp = input("Accept? [Y/n] ").strip().lower()
-    if inp == "" or inp == "y":
-        ev.save()
+    if inp != "" and inp != "y":
+        print("Event discarded.")
+        return
+
+    get_client().outbox.put(ev.to_api_data())
+    if not kwargs["wait"]:
+        run_detached("flush", "--background")
+        print("Event queued, it is being sent in the background.")
+        return
+
+    counts = get_client().flush()
+    if counts is None:
+        print("Event queued, another process is sending the outbox.")
+    elif counts["sent"]:
         print("Event saved to calendar.")
     else:
-        print("Event discarded.")
+        print("Event queued, it could not be sent yet (see `thallo flush`).")
+
+
+@click.command()
+@click.option(
+    "--discard-failed",
+    is_flag=True,
+    help="Remove the events Outlook refused from the outbox.",
+)
+@click.option(
+    "--background",
+    is_flag=True,
+    hidden=True,
+    help="Only send the events whose backoff is over, as `add` does when detached.",
+)
+def flush(discard_failed, background):
+    """Send the events queued by `add`, even those waiting to be retried."""
+    client = get_client()
+    if background:
+        # nobody sees the output of a detached flush, so keep the error with
+        # the events for `thallo flush` to show
+        try:
+            client.flush()
+        except Exception as e:
+            client.outbox.defer(f"{type(e).__name__}: {e}")
+            raise
+        return
+
+    counts = client.flush(force=True)
+    if counts is None:
+        print("Another process is sending the outbox.")
+        return
+    print(
+        f"{counts['sent']} sent, {counts['retry']} to retry, "
+        f"{counts['failed']} failed, {counts['waiting']} still waiting."
+    )
+
+    def show(p):
+        event = p["event"]
+        start = event["start"]["dateTime"][:16].replace("T", " ")
+        zone = event["start"]["timeZone"]
+        line = f"  {start} {zone}  {event['subject']}"
+        if p["error"]:
+            line += f" (after {p['attempts']} attempts: {p['error']})"
+        print(line)
+
+    pending = client.outbox.pending()
+    waiting = [p for p in pending if not p["failed"]]
+    if waiting:
+        print()
+        print("Waiting events:")
+        for p in waiting:
+            show(p)
+
+    failed = [p for p in pending if p["failed"]]
+    if discard_failed:
+        n = client.outbox.discard_failed()
+        print(f"Discarded {n} failed event{'s' if n != 1 else ''}.")
+    elif failed:
+        print()
+        print("Failed events (remove with `--discard-failed`):")
+        for p in failed:
+            show(p)
 
 
 @click.command()
@@ -244,10 +910,31 @@ def add(dates, **kwargs):
 )
 def authorize(email=None):
     """Fetch an OAuth2 token (requires a browser)."""
-    thallo.auth.run(utils.get_token_path(), authorize=True, email=email)
+    get_client().authorize(email=email)
     print("Successfully authenticated!")
 
 
+@click.command()
+@click.option(
+    "--keyring",
+    is_flag=True,
+    help="Also add the key to the user keyring of the kernel.",
+)
+def keygen(keyring):
+    """Generate a key for the `aead` token store."""
+    import thallo.store
+
+    key = thallo.store.generate_key()
+    if keyring:
+        description = utils.get_config_value(
+            "token_key", thallo.store.DEFAULT_KEY_DESCRIPTION, get_client().config_path
+        )
+        thallo.store.add_keyring_key(key, description)
+    # printed so that it can be kept somewhere safe, as the keyring is
+    # cleared on logout
+    print(thallo.store.encode_key(key))
+
+
 def main():
     entry()
 
@@ -256,3 +943,10 @@ entry.add_command(fetch)
 entry.add_command(add)
 entry.add_command(authorize)
 entry.add_command(info)
+entry.add_command(search)
+entry.add_command(watch)
+entry.add_command(remind)
+entry.add_command(stats)
+entry.add_command(keygen)
+entry.add_command(flush)
+entry.add_command(gateway)
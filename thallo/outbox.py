@@ -0,0 +1,247 @@
+"""
+A durable queue of events waiting to be created. `thallo add` only writes to
+the queue, so it works offline and returns at once, and the queue is sent by
+`thallo flush`, which `add` and every later command start in the background
+while events are due.
+
+Every queued event carries a `transactionId`, by which Graph recognises a
+create it has already done, so an event sent again after a lost response is
+not duplicated. Events are sent in JSON batches, sharing round trips.
+"""
+
+import json
+import math
+import time
+import uuid
+import fcntl
+import sqlite3
+import pathlib
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    transaction_id TEXT UNIQUE NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+"""
+
+# the most requests Graph accepts in one batch
+BATCH_SIZE = 20
+# statuses worth trying again later; any other error fails the event
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+MIN_RETRY = 30.0
+MAX_RETRY = 3600.0
+
+EVENTS_URL = "/me/calendar/events"
+
+
+def retry_delay(attempts: int, retry_after=None) -> float:
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), MIN_RETRY)
+        except ValueError:
+            pass
+    return min(MIN_RETRY * 2 ** (attempts - 1), MAX_RETRY)
+
+
+def error_message(response: dict) -> str:
+    body = response.get("body") or {}
+    error = body.get("error", {}) if isinstance(body, dict) else {}
+    return f"{response.get('status')}: {error.get('message', 'unknown error')}"
+
+
+class Outbox:
+    def __init__(self, path: pathlib.Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        # a library client hands the same outbox to all its threads; the lock
+        # serialises them, while `_lock` keeps other processes from flushing
+        self.lock = threading.RLock()
+
+    def close(self):
+        self.db.close()
+
+    def put(self, payload: dict) -> str:
+        """Queue the Graph representation of a new event."""
+        transaction_id = str(uuid.uuid4())
+        payload = dict(payload, transactionId=transaction_id)
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO outbox (transaction_id, payload, created) VALUES (?, ?, ?)",
+                (transaction_id, json.dumps(payload), time.time()),
+            )
+        return transaction_id
+
+    def due(self, now: float = None) -> int:
+        """The number of events ready to be sent."""
+        now = now or time.time()
+        with self.lock:
+            (n,) = self.db.execute(
+                "SELECT count(*) FROM outbox WHERE failed = 0 AND next_attempt <= ?",
+                (now,),
+            ).fetchone()
+        return n
+
+    def waiting(self) -> int:
+        """The number of events still to be sent, whether due or backing off."""
+        with self.lock:
+            (n,) = self.db.execute(
+                "SELECT count(*) FROM outbox WHERE failed = 0"
+            ).fetchone()
+        return n
+
+    def pending(self) -> list[dict]:
+        """Every queued event, failed or not, oldest first."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, payload, attempts, next_attempt, failed, error "
+                "FROM outbox ORDER BY id"
+            ).fetchall()
+        return [
+            {
+                "id": row_id,
+                "event": json.loads(payload),
+                "attempts": attempts,
+                "next_attempt": next_attempt,
+                "failed": bool(failed),
+                "error": error,
+            }
+            for row_id, payload, attempts, next_attempt, failed, error in rows
+        ]
+
+    def defer(self, error: str):
+        """
+        Put off every due event with `error`, as for a failed send, when
+        the flush could not even start (say, without a token).
+        """
+        with self.lock, self.db:
+            rows = self.db.execute(
+                "SELECT id, attempts FROM outbox WHERE failed = 0 AND next_attempt <= ?",
+                (time.time(),),
+            ).fetchall()
+            for row_id, attempts in rows:
+                self._retry(row_id, attempts + 1, error)
+
+    def discard_failed(self) -> int:
+        with self.lock, self.db:
+            return self.db.execute("DELETE FROM outbox WHERE failed = 1").rowcount
+
+    def _lock(self):
+        """
+        Take the flush lock without waiting, so that only one process sends
+        the queue at a time. Returns the open lock file, or None if another
+        process holds it.
+        """
+        f = open(self.path.with_suffix(".lock"), "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        return f
+
+    def _fail(self, row_id: int, attempts: int, error: str):
+        self.db.execute(
+            "UPDATE outbox SET failed = 1, attempts = ?, error = ? WHERE id = ?",
+            (attempts, error, row_id),
+        )
+
+    def _retry(self, row_id: int, attempts: int, error: str, retry_after=None):
+        self.db.execute(
+            "UPDATE outbox SET attempts = ?, next_attempt = ?, error = ? WHERE id = ?",
+            (
+                attempts,
+                time.time() + retry_delay(attempts, retry_after),
+                error,
+                row_id,
+            ),
+        )
+
+    def flush(self, calendar, force=False) -> dict:
+        """
+        Send every event that is due through `calendar`, or every event still
+        waiting with `force`, ignoring the backoff. Returns the number of
+        events `sent`, left to `retry` later, `failed` and still `waiting`
+        altogether, or None if another process is already flushing.
+        """
+        from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+        lock = self._lock()
+        if lock is None:
+            return None
+
+        counts = {"sent": 0, "retry": 0, "failed": 0}
+        try:
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT id, payload, attempts FROM outbox "
+                    "WHERE failed = 0 AND next_attempt <= ? ORDER BY id",
+                    (math.inf if force else time.time(),),
+                ).fetchall()
+
+            for i in range(0, len(rows), BATCH_SIZE):
+                chunk = rows[i : i + BATCH_SIZE]
+                requests = [
+                    {
+                        "id": str(row_id),
+                        "method": "POST",
+                        "url": EVENTS_URL,
+                        "headers": {"Content-Type": "application/json"},
+                        "body": json.loads(payload),
+                    }
+                    for row_id, payload, _ in chunk
+                ]
+                try:
+                    responses = calendar.batch(requests)
+                except (ConnectionError, Timeout, HTTPError) as e:
+                    status = getattr(e.response, "status_code", None)
+                    if isinstance(e, HTTPError) and status not in RETRY_STATUSES:
+                        # the batch itself was refused, and would be again
+                        with self.lock, self.db:
+                            for row_id, _, attempts in chunk:
+                                self._fail(row_id, attempts + 1, str(e))
+                        counts["failed"] += len(chunk)
+                        continue
+                    # the whole batch is retried, and the rest left for later
+                    retry_after = None
+                    if e.response is not None:
+                        retry_after = e.response.headers.get("Retry-After")
+                    with self.lock, self.db:
+                        for row_id, _, attempts in rows[i:]:
+                            self._retry(row_id, attempts + 1, str(e), retry_after)
+                    counts["retry"] += len(rows) - i
+                    break
+
+                with self.lock, self.db:
+                    for row_id, _, attempts in chunk:
+                        response = responses.get(str(row_id), {})
+                        status = response.get("status")
+                        if status is not None and 200 <= status < 300:
+                            self.db.execute(
+                                "DELETE FROM outbox WHERE id = ?", (row_id,)
+                            )
+                            counts["sent"] += 1
+                        elif status is None or status in RETRY_STATUSES:
+                            headers = response.get("headers") or {}
+                            self._retry(
+                                row_id,
+                                attempts + 1,
+                                error_message(response),
+                                headers.get("Retry-After"),
+                            )
+                            counts["retry"] += 1
+                        else:
+                            self._fail(row_id, attempts + 1, error_message(response))
+                            counts["failed"] += 1
+        finally:
+            lock.close()
+        counts["waiting"] = self.waiting()
+        return counts
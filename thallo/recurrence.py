@@ -0,0 +1,307 @@
+"""
+Local expansion of recurring series. Instead of letting the server expand and
+send every occurrence of a series, the series master (and its exceptions) is
+fetched once and cached, and the occurrences are computed here from the
+recurrence pattern.
+"""
+
+import json
+import calendar
+import pathlib
+
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from datetime import date, datetime, timedelta, timezone
+
+from O365.utils.windows_tz import get_iana_tz
+
+WEEKDAYS = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+
+INDICES = {"first": 0, "second": 1, "third": 2, "fourth": 3, "last": -1}
+
+GRAPH_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def parse_graph_time(obj: dict) -> datetime:
+    """Parse a Graph `dateTimeTimeZone` resource into an aware datetime."""
+    tz = get_zone(obj.get("timeZone", "UTC"))
+    # graph gives up to 7 digits of fractional seconds
+    return datetime.fromisoformat(obj["dateTime"][:19]).replace(tzinfo=tz)
+
+
+def to_graph_time(dt: datetime) -> dict:
+    return {
+        "dateTime": dt.astimezone(timezone.utc).strftime(GRAPH_TIME_FORMAT),
+        "timeZone": "UTC",
+    }
+
+
+def get_zone(name: str, default=timezone.utc):
+    if not name:
+        return default
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        pass
+    try:
+        return get_iana_tz(name)
+    except ZoneInfoNotFoundError:
+        return default
+
+
+def _add_months(year: int, month: int, n: int) -> tuple[int, int]:
+    m = month - 1 + n
+    return year + m // 12, m % 12 + 1
+
+
+def _weekdays(pattern: dict) -> list[int]:
+    return sorted(WEEKDAYS.index(d.lower()) for d in pattern.get("daysOfWeek", []))
+
+
+def _day_in_month(year: int, month: int, day: int) -> date:
+    # outlook puts the occurrence on the last day for shorter months
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def _relative_day(year: int, month: int, days: list[int], index: str) -> date:
+    if not days:
+        raise ValueError("A relative recurrence pattern needs `daysOfWeek`")
+    n_days = calendar.monthrange(year, month)[1]
+    matching = [
+        date(year, month, d)
+        for d in range(1, n_days + 1)
+        if date(year, month, d).weekday() in days
+    ]
+    i = INDICES.get(index or "first", 0)
+    return matching[i] if i < len(matching) else matching[-1]
+
+
+def _candidate_dates(pattern: dict, start: date):
+    """Yield the dates matching a recurrence pattern, in order, from `start`."""
+    kind = pattern["type"]
+    interval = pattern.get("interval", 1) or 1
+
+    # without any days, these patterns have no occurrences at all
+    if kind in ("weekly", "relativeMonthly", "relativeYearly"):
+        if not pattern.get("daysOfWeek"):
+            return
+
+    if kind == "daily":
+        d = start
+        while True:
+            yield d
+            d += timedelta(days=interval)
+
+    elif kind == "weekly":
+        days = _weekdays(pattern)
+        first = WEEKDAYS.index(pattern.get("firstDayOfWeek", "sunday").lower())
+        offsets = sorted((d - first) % 7 for d in days)
+        week = start - timedelta(days=(start.weekday() - first) % 7)
+        while True:
+            for off in offsets:
+                d = week + timedelta(days=off)
+                if d >= start:
+                    yield d
+            week += timedelta(weeks=interval)
+
+    elif kind in ("absoluteMonthly", "relativeMonthly"):
+        year, month = start.year, start.month
+        while True:
+            if kind == "absoluteMonthly":
+                d = _day_in_month(year, month, pattern["dayOfMonth"])
+            else:
+                d = _relative_day(year, month, _weekdays(pattern), pattern["index"])
+            if d >= start:
+                yield d
+            year, month = _add_months(year, month, interval)
+
+    elif kind in ("absoluteYearly", "relativeYearly"):
+        year, month = start.year, pattern["month"]
+        while True:
+            if kind == "absoluteYearly":
+                d = _day_in_month(year, month, pattern["dayOfMonth"])
+            else:
+                d = _relative_day(year, month, _weekdays(pattern), pattern["index"])
+            if d >= start:
+                yield d
+            year += interval
+
+    else:
+        raise ValueError(f"Unknown recurrence pattern type '{kind}'")
+
+
+def _timing(master: dict):
+    """The time zone, wall-clock start time and duration of the occurrences."""
+    rng = master["recurrence"]["range"]
+    first_start = parse_graph_time(master["start"])
+    duration = parse_graph_time(master["end"]) - first_start
+
+    # occurrences keep their wall-clock time in the recurrence time zone
+    tz = get_zone(rng.get("recurrenceTimeZone"), first_start.tzinfo)
+    return tz, first_start.astimezone(tz).time(), duration
+
+
+def last_end(master: dict) -> datetime | None:
+    """
+    When the last occurrence of a series ends, or None if it never ends. Only
+    needs the `recurrence`, `start` and `end` of the master.
+    """
+    rng = master["recurrence"]["range"]
+    tz, wall_time, duration = _timing(master)
+
+    if rng.get("type") == "endDate":
+        # the end date itself may not be an occurrence, but ending there is
+        # close enough to know the series is over
+        last = date.fromisoformat(rng["endDate"])
+    elif rng.get("type") == "numbered":
+        last = None
+        dates = _candidate_dates(
+            master["recurrence"]["pattern"], date.fromisoformat(rng["startDate"])
+        )
+        for _, last in zip(range(rng.get("numberOfOccurrences") or 0), dates):
+            pass
+        if last is None:
+            return datetime.fromisoformat(rng["startDate"]).replace(tzinfo=tz)
+    else:
+        return None
+    return datetime.combine(last, wall_time, tzinfo=tz) + duration
+
+
+def expand(master: dict, window_start: datetime, window_end: datetime) -> list:
+    """
+    Return the (start, end) times of every occurrence of a series master that
+    overlaps the window, matching the semantics of a Graph calendar view.
+    """
+    recurrence = master["recurrence"]
+    pattern = recurrence["pattern"]
+    rng = recurrence["range"]
+
+    tz, wall_time, duration = _timing(master)
+
+    range_start = date.fromisoformat(rng["startDate"])
+    range_end = None
+    if rng.get("type") == "endDate":
+        range_end = date.fromisoformat(rng["endDate"])
+    count = rng.get("numberOfOccurrences") if rng.get("type") == "numbered" else None
+
+    last_date = (window_end.astimezone(tz) + duration).date()
+
+    occurrences = []
+    for n, d in enumerate(_candidate_dates(pattern, range_start)):
+        if count is not None and n >= count:
+            break
+        if range_end is not None and d > range_end:
+            break
+        if d > last_date:
+            break
+
+        start = datetime.combine(d, wall_time, tzinfo=tz)
+        end = start + duration
+        if start < window_end and end > window_start:
+            occurrences.append((start, end))
+
+    return occurrences
+
+
+def original_start_key(value: str | datetime) -> str:
+    """Normalise an occurrence start so that it can be used as a key."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value[:19]).replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def make_occurrence(master: dict, start: datetime, end: datetime) -> dict:
+    """Build the cloud data of a single occurrence from its series master."""
+    occ = dict(master)
+    occ.pop("recurrence", None)
+    occ["id"] = f"{master['id']}/{original_start_key(start)}"
+    occ["type"] = "occurrence"
+    occ["seriesMasterId"] = master["id"]
+    occ["start"] = to_graph_time(start)
+    occ["end"] = to_graph_time(end)
+    occ["originalStart"] = original_start_key(start)
+    return occ
+
+
+class SeriesCache:
+    """
+    Series masters and their exceptions, keyed by master id and stored on
+    disk. An entry is only valid for the master's current `changeKey`, which
+    changes whenever the series or any of its exceptions is edited.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.series = {}
+        if self.path.exists():
+            self.series = json.loads(self.path.read_text())
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.series))
+
+    def get(self, master_id: str, change_key: str) -> dict | None:
+        entry = self.series.get(master_id)
+        if entry and entry["master"].get("changeKey") == change_key:
+            return entry
+        return None
+
+    def put(self, master: dict) -> dict:
+        entry = {"master": master, "exceptions": {}, "cancelled": [], "covered": []}
+        self.series[master["id"]] = entry
+        return entry
+
+    def prune(self, before: datetime):
+        """Drop the series that ended before a date."""
+        for master_id, entry in list(self.series.items()):
+            ended = last_end(entry["master"])
+            if ended is not None and ended <= before:
+                del self.series[master_id]
+
+    @staticmethod
+    def covers(entry: dict, start: datetime, end: datetime) -> bool:
+        s, e = start.timestamp(), end.timestamp()
+        return any(cs <= s and e <= ce for cs, ce in entry["covered"])
+
+    @staticmethod
+    def add_covered(entry: dict, start: datetime, end: datetime):
+        spans = sorted(entry["covered"] + [[start.timestamp(), end.timestamp()]])
+        merged = [spans[0]]
+        for s, e in spans[1:]:
+            if s <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+        entry["covered"] = merged
+
+
+def instances(entry: dict, window_start: datetime, window_end: datetime) -> list:
+    """
+    Expand a cached series into the cloud data of every instance in the
+    window, with cancelled occurrences removed and exceptions substituted.
+    """
+    master = entry["master"]
+    cancelled = set(entry["cancelled"])
+    exceptions = entry["exceptions"]
+
+    out = []
+    for start, end in expand(master, window_start, window_end):
+        key = original_start_key(start)
+        if key in cancelled or key in exceptions:
+            continue
+        out.append(make_occurrence(master, start, end))
+
+    for exc in exceptions.values():
+        start = parse_graph_time(exc["start"])
+        end = parse_graph_time(exc["end"])
+        if start < window_end and end > window_start:
+            out.append(exc)
+
+    return out
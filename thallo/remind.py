@@ -0,0 +1,166 @@
+"""
+A reminder scheduler. Upcoming events are kept in a heap ordered by the time
+of their reminder, and the scheduler sleeps until exactly the next one is due.
+The calendar is only polled on a slow, adaptive schedule, through the same
+delta queries as `thallo watch`.
+"""
+
+import os
+import json
+import time
+import heapq
+import threading
+import subprocess
+
+from datetime import datetime, timedelta
+
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+from thallo.calendar import Calendar
+from thallo.watch import Watcher, REMOVED, retryable
+
+
+def print_hook(event: dict):
+    """The default hook: print the reminder to stdout."""
+    start = event["start_time"].astimezone()
+    minutes = round((event["start_time"].timestamp() - time.time()) / 60)
+    when = f"in {minutes} minutes" if minutes > 0 else "now"
+    print(f"{start:%H:%M} {event['name']} starts {when}", flush=True)
+
+
+def command_hook(command: str):
+    """
+    A hook that runs a shell command for each reminder, with the event in the
+    `THALLO_NAME`, `THALLO_START`, `THALLO_END`, `THALLO_LOCATION` and
+    `THALLO_EVENT` (as JSON) environment variables. The command runs in the
+    background, so a slow command does not delay the next reminder.
+    """
+
+    def hook(event: dict):
+        loc = event["location"] or {}
+        start = event["start_time"].isoformat()
+        end = event["end_time"].isoformat()
+        env = dict(
+            os.environ,
+            THALLO_NAME=event["name"] or "",
+            THALLO_START=start,
+            THALLO_END=end,
+            THALLO_LOCATION=loc.get("displayName", loc.get("uniqueId", "")) or "",
+            THALLO_EVENT=json.dumps(dict(event, start_time=start, end_time=end)),
+        )
+        subprocess.Popen(command, shell=True, env=env)
+
+    return hook
+
+
+class Reminder:
+    """
+    Calls `hook` with each upcoming event `before` its start.
+
+    Entries in the heap are never removed or updated in place. Instead each
+    event has a version, bumped whenever it changes, and entries with an old
+    version are skipped when they come to the top.
+    """
+
+    def __init__(
+        self,
+        calendar: Calendar,
+        hook=print_hook,
+        before=timedelta(minutes=5),
+        days=1,
+        min_refresh=60.0,
+        max_refresh=900.0,
+    ):
+        self.hook = hook
+        self.before = before
+        self.watcher = Watcher(
+            calendar,
+            None,
+            days=days,
+            min_interval=min_refresh,
+            max_interval=max_refresh,
+        )
+
+        self.heap = []
+        self.versions = {}
+        self.fired = set()
+        self._counter = 0
+
+    def _schedule(self, event_id: str, event: dict):
+        self._counter += 1
+        self.versions[event_id] = self._counter
+        when = (event["start_time"] - self.before).timestamp()
+        heapq.heappush(self.heap, (when, self._counter, event_id, event))
+
+    def apply(self, changes: list[dict]):
+        """Update the heap from a list of change records."""
+        for change in changes:
+            event_id = change["id"]
+            if change["change"] == REMOVED:
+                self.versions.pop(event_id, None)
+                continue
+            event = dict(
+                change["event"],
+                start_time=datetime.fromisoformat(change["event"]["start_time"]),
+                end_time=datetime.fromisoformat(change["event"]["end_time"]),
+            )
+            self._schedule(event_id, event)
+
+    def fire_due(self, now: float):
+        """Run the hook for every reminder that is due."""
+        while self.heap and self.heap[0][0] <= now:
+            _, version, event_id, event = heapq.heappop(self.heap)
+            if self.versions.get(event_id) != version:
+                continue
+            # reminders for events that have already started are dropped, and
+            # an event is only reminded of once for each start time
+            key = (event_id, event["start_time"])
+            if event["start_time"].timestamp() <= now or key in self.fired:
+                continue
+            self.fired.add(key)
+            self.hook(event)
+
+    def prune(self, now: float):
+        """
+        Forget the reminders of events that have started, which can never
+        fire again, so that a long-running reminder does not grow.
+        """
+        self.fired = {k for k in self.fired if k[1].timestamp() > now}
+
+    def next_deadline(self) -> float | None:
+        while self.heap and self.versions.get(self.heap[0][2]) != self.heap[0][1]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def run(self, stop: threading.Event = None, on_error=None):
+        """
+        Fire reminders until `stop` is set, refreshing the events from the
+        server when the watcher's interval has elapsed. Failed refreshes are
+        passed to `on_error` (if given) and retried as in `Watcher.run`.
+        """
+        stop = stop or threading.Event()
+        next_refresh = 0.0
+
+        while not stop.is_set():
+            now = time.time()
+            if now >= next_refresh:
+                try:
+                    changes = self.watcher.poll()
+                except (ConnectionError, Timeout, HTTPError) as e:
+                    if not retryable(e):
+                        raise
+                    if on_error is not None:
+                        on_error(e)
+                    self.watcher.interval = self.watcher.max_interval
+                else:
+                    self.apply(changes)
+                    self.watcher.interval = self.watcher.next_interval(len(changes))
+                now = time.time()
+                next_refresh = now + self.watcher.interval
+                self.prune(now)
+
+            self.fire_due(now)
+
+            deadline = self.next_deadline()
+            wake = next_refresh if deadline is None else min(deadline, next_refresh)
+            stop.wait(max(0.0, wake - time.time()))
@@ -0,0 +1,301 @@
+"""
+Meeting-load statistics. Events are turned into NumPy columns once, and every
+aggregate is then computed on whole arrays, so a year of events for a team
+takes milliseconds. Needs the optional `numpy` package
+(`pip install thallo[stats]`).
+
+Times are handled as local "wall clock" seconds (seconds since the epoch, plus
+the UTC offset in force at that moment), so days and hours line up with the
+local calendar across changes of daylight saving time.
+"""
+
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    raise Exception(
+        "`thallo stats` needs the `numpy` package (`pip install thallo[stats]`)"
+    )
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+SHADES = " ░▒▓█"
+
+
+def local_seconds(dt: datetime) -> float:
+    local = dt.astimezone()
+    return local.timestamp() + local.utcoffset().total_seconds()
+
+
+def wall_time(seconds: float) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(seconds=float(seconds))
+
+
+def organizer_name(event: dict) -> str:
+    organizer = event.get("organizer") or {}
+    return organizer.get("address") or organizer.get("name") or ""
+
+
+class EventArrays:
+    """
+    The events as columns: `start` and `end` in local seconds, the number of
+    `attendees`, and `organizer` as codes into the `organizers` names.
+    """
+
+    def __init__(self, start, end, attendees, organizer, organizers):
+        self.start = start
+        self.end = end
+        self.attendees = attendees
+        self.organizer = organizer
+        self.organizers = organizers
+
+    @classmethod
+    def from_events(cls, events: list[dict]) -> "EventArrays":
+        n = len(events)
+        start = np.fromiter((local_seconds(e["start_time"]) for e in events), float, n)
+        end = np.fromiter((local_seconds(e["end_time"]) for e in events), float, n)
+        attendees = np.fromiter((len(e["attendees"]) for e in events), np.int32, n)
+        organizers, organizer = np.unique(
+            np.array([organizer_name(e) for e in events], dtype=str),
+            return_inverse=True,
+        )
+        return cls(start, end, attendees, organizer.reshape(-1), organizers)
+
+    def __len__(self):
+        return len(self.start)
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def select(self, mask) -> "EventArrays":
+        return EventArrays(
+            self.start[mask],
+            self.end[mask],
+            self.attendees[mask],
+            self.organizer[mask],
+            self.organizers,
+        )
+
+
+def merge(start, end):
+    """The union of a set of intervals, as sorted disjoint intervals."""
+    if len(start) == 0:
+        return start, end
+    order = np.argsort(start, kind="stable")
+    s = start[order]
+    reach = np.maximum.accumulate(end[order])
+    first = np.flatnonzero(np.r_[True, s[1:] > reach[:-1]])
+    last = np.r_[first[1:] - 1, len(s) - 1]
+    return s[first], reach[last]
+
+
+def streaks(start, end, slack: float):
+    """
+    Runs of meetings that each start within `slack` seconds of the end of
+    the ones before. Returns the number of meetings, the start and the end of
+    every run of two or more.
+    """
+    if len(start) == 0:
+        return np.zeros(0, int), start, end
+    order = np.argsort(start, kind="stable")
+    s = start[order]
+    reach = np.maximum.accumulate(end[order])
+    breaks = np.r_[True, s[1:] - reach[:-1] > slack]
+    first = np.flatnonzero(breaks)
+    last = np.r_[first[1:] - 1, len(s) - 1]
+    counts = last - first + 1
+    keep = counts > 1
+    return counts[keep], s[first][keep], reach[last][keep]
+
+
+def busy_minutes(start, end, origin: float, days: int):
+    """A boolean grid of shape `(days, 24, 60)`, true where any meeting runs."""
+    n = days * 24 * 60
+    first = np.clip(np.floor((start - origin) / MINUTE), 0, n).astype(np.int64)
+    last = np.clip(np.ceil((end - origin) / MINUTE), 0, n).astype(np.int64)
+    diff = np.zeros(n + 1, np.int64)
+    np.add.at(diff, first, 1)
+    np.add.at(diff, last, -1)
+    return (np.cumsum(diff[:-1]) > 0).reshape(days, 24, 60)
+
+
+def focus_gaps(busy_start, busy_end, origin, weekdays, work_hours, min_gap):
+    """
+    The free stretches of at least `min_gap` seconds inside working hours on
+    weekdays. Time outside working hours is added to the busy intervals, so
+    the gaps left between the merged intervals are exactly the free working
+    time.
+    """
+    day = np.flatnonzero(weekdays < 5)
+    open_at = origin + day * DAY + work_hours[0] * HOUR
+    close_at = origin + day * DAY + work_hours[1] * HOUR
+    off_start = np.r_[-np.inf, close_at]
+    off_end = np.r_[open_at, np.inf]
+
+    s, e = merge(np.r_[busy_start, off_start], np.r_[busy_end, off_end])
+    gap_start, gap_end = e[:-1], s[1:]
+    keep = gap_end - gap_start >= min_gap
+    return gap_start[keep], gap_end[keep]
+
+
+def summarize(
+    arrays: EventArrays,
+    start: datetime,
+    end: datetime,
+    work_hours=(9, 17),
+    min_focus=timedelta(hours=2),
+    slack=timedelta(minutes=5),
+) -> dict:
+    """
+    Aggregate the meeting load between two dates (local midnights). All-day
+    events are counted but left out of the load.
+    """
+    origin = local_seconds(start)
+    days = max(1, round((local_seconds(end) - origin) / DAY))
+    stop = origin + days * DAY
+
+    # only events that overlap the range, clipped to it
+    timed = arrays.select(
+        (arrays.duration < DAY) & (arrays.end > origin) & (arrays.start < stop)
+    )
+    t_start = np.clip(timed.start, origin, stop)
+    t_end = np.clip(timed.end, origin, stop)
+
+    dates = [start.date() + timedelta(days=d) for d in range(days)]
+    weekdays = (start.weekday() + np.arange(days)) % 7
+
+    busy = busy_minutes(t_start, t_end, origin, days)
+    hours_per_day = busy.sum(axis=(1, 2)) / 60
+    busy_per_hour = busy.sum(axis=2) / 60
+
+    # average busy fraction of each hour of the week
+    heat = np.zeros((7, 24))
+    np.add.at(heat, weekdays, busy_per_hour)
+    heat /= np.maximum(np.bincount(weekdays, minlength=7), 1)[:, None]
+
+    week = (np.arange(days) + start.weekday()) // 7
+    hours_per_week = np.bincount(week, weights=hours_per_day)
+
+    counts, s_start, s_end = streaks(t_start, t_end, slack.total_seconds())
+    longest = None
+    if len(counts):
+        i = np.lexsort((-(s_end - s_start), -counts))[0]
+        longest = {
+            "meetings": int(counts[i]),
+            "start": wall_time(s_start[i]).isoformat(),
+            "end": wall_time(s_end[i]).isoformat(),
+        }
+
+    b_start, b_end = merge(t_start, t_end)
+    g_start, g_end = focus_gaps(
+        b_start, b_end, origin, weekdays, work_hours, min_focus.total_seconds()
+    )
+    gap_day = ((g_start - origin) // DAY).astype(np.int64)
+    focus_per_day = np.bincount(gap_day, weights=g_end - g_start, minlength=days)
+
+    # time in meetings, by organizer
+    org_hours = np.bincount(
+        timed.organizer, weights=t_end - t_start, minlength=len(arrays.organizers)
+    )
+    org_events = np.bincount(timed.organizer, minlength=len(arrays.organizers))
+    top = np.argsort(-org_hours, kind="stable")[:5]
+
+    n_workdays = int((weekdays < 5).sum())
+    return {
+        "from": str(start.date()),
+        "to": str(dates[-1]),
+        "events": len(arrays),
+        "timed_events": len(timed),
+        "busy_hours": float(hours_per_day.sum()),
+        "busy_hours_per_workday": float(
+            hours_per_day[weekdays < 5].sum() / max(n_workdays, 1)
+        ),
+        "mean_attendees": float(timed.attendees.mean()) if len(timed) else 0.0,
+        "hours_per_day": [
+            {"date": str(d), "hours": float(h)} for d, h in zip(dates, hours_per_day)
+        ],
+        "hours_per_week": [
+            {
+                "week": "{}-W{:02}".format(*dates[min(w * 7, days - 1)].isocalendar()),
+                "hours": float(h),
+            }
+            for w, h in enumerate(hours_per_week)
+        ],
+        "back_to_back": {
+            "streaks": len(counts),
+            "meetings": int(counts.sum()),
+            "longest": longest,
+        },
+        "focus": {
+            "min_hours": min_focus.total_seconds() / HOUR,
+            "gaps": len(g_start),
+            "hours": float((g_end - g_start).sum() / HOUR),
+            "hours_per_workday": float(focus_per_day.sum() / HOUR / max(n_workdays, 1)),
+        },
+        "organizers": [
+            {
+                "organizer": str(arrays.organizers[i]),
+                "events": int(org_events[i]),
+                "hours": float(org_hours[i] / HOUR),
+            }
+            for i in top
+            if org_events[i] > 0
+        ],
+        "heatmap": heat.round(3).tolist(),
+    }
+
+
+def format_summary(summary: dict, hours=range(7, 20)) -> str:
+    """A plain-text report of a summary."""
+    lines = [
+        f"{summary['from']} to {summary['to']}: {summary['events']} events",
+        "",
+        f"  Busy:         {summary['busy_hours']:.1f} h "
+        f"({summary['busy_hours_per_workday']:.1f} h per working day)",
+    ]
+    b2b = summary["back_to_back"]
+    lines.append(f"  Back-to-back: {b2b['streaks']} runs, {b2b['meetings']} meetings")
+    if b2b["longest"]:
+        longest = b2b["longest"]
+        lines.append(
+            f"                longest {longest['meetings']} meetings, "
+            f"{longest['start'][:16]} to {longest['end'][11:16]}"
+        )
+    focus = summary["focus"]
+    lines.append(
+        f"  Focus:        {focus['hours']:.1f} h in {focus['gaps']} gaps of "
+        f"{focus['min_hours']:g} h or more ({focus['hours_per_workday']:.1f} h per "
+        "working day)"
+    )
+    lines.append(f"  Attendees:    {summary['mean_attendees']:.1f} on average")
+
+    lines += ["", "  Hours per week:"]
+    peak = max([w["hours"] for w in summary["hours_per_week"]] + [1])
+    for w in summary["hours_per_week"]:
+        bar = "█" * round(30 * w["hours"] / peak)
+        lines.append(f"    {w['week']} {w['hours']:5.1f} {bar}")
+
+    if summary["organizers"]:
+        lines += ["", "  Organizers:"]
+        for o in summary["organizers"]:
+            name = o["organizer"] or "(unknown)"
+            lines.append(f"    {o['hours']:5.1f} h {o['events']:4} events  {name}")
+
+    lines += [
+        "",
+        "  Busy by hour of week:",
+        "        " + "".join(f"{h:<3}" for h in hours),
+    ]
+    heat = summary["heatmap"]
+    for day, row in enumerate(heat):
+        cells = "".join(
+            SHADES[min(int(row[h] * len(SHADES)), len(SHADES) - 1)] * 2 + " "
+            for h in hours
+        )
+        lines.append(f"    {DAY_NAMES[day]} {cells}")
+    return "\n".join(lines)
@@ -0,0 +1,302 @@
+"""
+Backends that keep the token file encrypted at rest.
+
+- `GpgStore` pipes the token through `gpg`, as thallo always has. Every read
+  and write starts a `gpg` process and a round trip to its agent.
+- `AeadStore` encrypts the token in-process with AES-256-GCM, using a key
+  from the environment, an inherited file descriptor, or the Linux kernel
+  keyring. Unlocking the token then needs no child processes. It requires the
+  optional `cryptography` package (`pip install thallo[aead]`).
+
+The backend is chosen with `token_store` in the `[general]` section of the
+configuration file.
+"""
+
+import os
+import abc
+import json
+import base64
+import ctypes
+import ctypes.util
+import pathlib
+import secrets
+import subprocess
+
+import thallo.utils as utils
+
+DECRYPTION_PIPE = ["gpg", "--decrypt"]
+
+AEAD_MAGIC = b"thallo-aead-v1\n"
+NONCE_SIZE = 12
+KEY_SIZE = 32
+
+KEY_ENV = "THALLO_TOKEN_KEY"
+KEY_FD_ENV = "THALLO_TOKEN_KEY_FD"
+DEFAULT_KEY_DESCRIPTION = "thallo:token"
+
+# special keyring ids from <keyutils.h>
+KEY_SPEC_USER_KEYRING = -4
+
+# a key read from a file descriptor, which can only be read once
+_fd_key = None
+
+
+class TokenStore(abc.ABC):
+    """Reads and writes the token dict of a token file."""
+
+    name = None
+
+    @abc.abstractmethod
+    def load(self, path: pathlib.Path) -> dict:
+        pass
+
+    @abc.abstractmethod
+    def save(self, path: pathlib.Path, token: dict):
+        pass
+
+
+class GpgStore(TokenStore):
+    """
+    Encrypts the token to a gpg recipient. Unless given, the recipient is only
+    looked up when something is encrypted, so reading tokens does not need a
+    configured recipient.
+    """
+
+    name = "gpg"
+
+    def __init__(self, recipient=None, config_path=None):
+        self.recipient = recipient
+        self.config_path = config_path
+
+    def encryption_pipe(self) -> list[str]:
+        recipient = self.recipient or utils.get_gpg_recipient(self.config_path)
+        return ["gpg", "--encrypt", "--recipient", recipient]
+
+    def load(self, path: pathlib.Path) -> dict:
+        try:
+            sub = subprocess.run(
+                DECRYPTION_PIPE,
+                check=True,
+                input=path.read_bytes(),
+                capture_output=True,
+            )
+        except subprocess.CalledProcessError:
+            raise Exception(
+                "Difficulty decrypting token file. Is your decryption agent primed for "
+                "non-interactive usage, or an appropriate environment variable such as "
+                "GPG_TTY set to allow interactive agent usage from inside a pipe?"
+            )
+        return json.loads(sub.stdout)
+
+    def save(self, path: pathlib.Path, token: dict):
+        sub = subprocess.run(
+            self.encryption_pipe(),
+            check=True,
+            input=json.dumps(token).encode(),
+            capture_output=True,
+        )
+        path.write_bytes(sub.stdout)
+
+
+def _keyutils():
+    name = ctypes.util.find_library("keyutils")
+    if name is None:
+        raise Exception("libkeyutils is needed to use the kernel keyring")
+    lib = ctypes.CDLL(name, use_errno=True)
+    lib.keyctl_search.argtypes = [
+        ctypes.c_int32,
+        ctypes.c_char_p,
+        ctypes.c_char_p,
+        ctypes.c_int32,
+    ]
+    lib.keyctl_search.restype = ctypes.c_long
+    lib.keyctl_read_alloc.argtypes = [ctypes.c_int32, ctypes.POINTER(ctypes.c_void_p)]
+    lib.keyctl_read_alloc.restype = ctypes.c_long
+    lib.add_key.argtypes = [
+        ctypes.c_char_p,
+        ctypes.c_char_p,
+        ctypes.c_void_p,
+        ctypes.c_size_t,
+        ctypes.c_int32,
+    ]
+    lib.add_key.restype = ctypes.c_int32
+    return lib
+
+
+def keyring_key(description=DEFAULT_KEY_DESCRIPTION) -> bytes | None:
+    """Read a `user` key from the user keyring, if it is there."""
+    lib = _keyutils()
+    serial = lib.keyctl_search(KEY_SPEC_USER_KEYRING, b"user", description.encode(), 0)
+    if serial < 0:
+        return None
+
+    buffer = ctypes.c_void_p()
+    size = lib.keyctl_read_alloc(serial, ctypes.byref(buffer))
+    if size < 0:
+        errno = ctypes.get_errno()
+        raise Exception(f"Could not read key `{description}`: {os.strerror(errno)}")
+    try:
+        return ctypes.string_at(buffer, size)
+    finally:
+        libc = ctypes.CDLL(None)
+        libc.free.argtypes = [ctypes.c_void_p]
+        libc.free(buffer)
+
+
+def add_keyring_key(key: bytes, description=DEFAULT_KEY_DESCRIPTION):
+    """Add (or replace) a `user` key in the user keyring."""
+    lib = _keyutils()
+    serial = lib.add_key(
+        b"user", description.encode(), key, len(key), KEY_SPEC_USER_KEYRING
+    )
+    if serial < 0:
+        errno = ctypes.get_errno()
+        raise Exception(f"Could not add key `{description}`: {os.strerror(errno)}")
+
+
+def decode_key(text: str) -> bytes:
+    key = base64.b64decode(text.strip())
+    if len(key) != KEY_SIZE:
+        raise Exception(f"Token key must be {KEY_SIZE} bytes, got {len(key)}")
+    return key
+
+
+def encode_key(key: bytes) -> str:
+    return base64.b64encode(key).decode()
+
+
+def generate_key() -> bytes:
+    return secrets.token_bytes(KEY_SIZE)
+
+
+def _read_fd_key() -> bytes | None:
+    """The key from `THALLO_TOKEN_KEY_FD`, read on first use and kept."""
+    global _fd_key
+    if _fd_key is None and KEY_FD_ENV in os.environ:
+        with os.fdopen(int(os.environ.pop(KEY_FD_ENV)), "r") as f:
+            _fd_key = decode_key(f.read())
+    return _fd_key
+
+
+def child_key_fds() -> tuple[dict, tuple]:
+    """
+    The environment variables and file descriptors that hand a key given by
+    file descriptor on to a child process, which cannot read the consumed
+    descriptor again. The key is written to a fresh pipe, whose read end the
+    caller must pass to the child (`pass_fds`) and then close. Without such
+    a key, there is nothing to pass.
+    """
+    key = _read_fd_key()
+    if key is None:
+        return {}, ()
+    read, write = os.pipe()
+    try:
+        os.write(write, encode_key(key).encode())
+    finally:
+        os.close(write)
+    return {KEY_FD_ENV: str(read)}, (read,)
+
+
+def find_key(description=DEFAULT_KEY_DESCRIPTION) -> bytes:
+    """
+    Find the key for the token file: the base64 key in `THALLO_TOKEN_KEY`, else
+    the base64 key read from the file descriptor in `THALLO_TOKEN_KEY_FD`,
+    else the key `description` in the user keyring.
+    """
+    if KEY_ENV in os.environ:
+        return decode_key(os.environ[KEY_ENV])
+
+    if _read_fd_key() is not None:
+        return _fd_key
+
+    key = keyring_key(description)
+    if key is None:
+        raise Exception(
+            f"No token key found. Set {KEY_ENV} or {KEY_FD_ENV}, or add the key "
+            f"`{description}` to your user keyring (see `thallo keygen`)."
+        )
+    if len(key) != KEY_SIZE:
+        raise Exception(f"Token key must be {KEY_SIZE} bytes, got {len(key)}")
+    return key
+
+
+class AeadStore(TokenStore):
+    """
+    Encrypts the token with AES-256-GCM. The file holds a header, a random
+    nonce and the ciphertext; the header is authenticated along with the
+    token. The key is looked up (see `find_key`) on first use only.
+
+    A token file still encrypted with gpg is read through gpg once, and
+    written back in the new format.
+    """
+
+    name = "aead"
+
+    def __init__(self, key: bytes = None, description=DEFAULT_KEY_DESCRIPTION):
+        try:
+            from cryptography.exceptions import InvalidTag
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        except ImportError:
+            raise Exception(
+                "The `aead` token store needs the `cryptography` package "
+                "(`pip install thallo[aead]`)"
+            )
+        self._cipher = AESGCM
+        self._invalid = InvalidTag
+        self._key = key
+        self.description = description
+        self._aead = None
+
+    @property
+    def aead(self):
+        if self._aead is None:
+            self._aead = self._cipher(self._key or find_key(self.description))
+        return self._aead
+
+    def load(self, path: pathlib.Path) -> dict:
+        data = path.read_bytes()
+        if not data.startswith(AEAD_MAGIC):
+            token = GpgStore().load(path)
+            self.save(path, token)
+            return token
+
+        body = data[len(AEAD_MAGIC) :]
+        nonce, ciphertext = body[:NONCE_SIZE], body[NONCE_SIZE:]
+        try:
+            plaintext = self.aead.decrypt(nonce, ciphertext, AEAD_MAGIC)
+        except self._invalid:
+            raise Exception(
+                "Could not decrypt the token file: wrong key, or the file is damaged."
+            )
+        return json.loads(plaintext)
+
+    def save(self, path: pathlib.Path, token: dict):
+        nonce = secrets.token_bytes(NONCE_SIZE)
+        ciphertext = self.aead.encrypt(nonce, json.dumps(token).encode(), AEAD_MAGIC)
+        path.write_bytes(AEAD_MAGIC + nonce + ciphertext)
+
+
+STORES = {
+    GpgStore.name: GpgStore,
+    AeadStore.name: AeadStore,
+}
+
+
+def get_store(
+    config_path: pathlib.Path = None, recipient=None, name=None
+) -> TokenStore:
+    """
+    The token store selected by `name`, or else by `token_store` in the
+    configuration file (`gpg` by default).
+    """
+    name = name or utils.get_config_value("token_store", "gpg", config_path)
+    if name not in STORES:
+        raise Exception(
+            f"Unknown token store `{name}` (expected one of {', '.join(STORES)})"
+        )
+    if name == GpgStore.name:
+        return GpgStore(recipient=recipient, config_path=config_path)
+    description = utils.get_config_value(
+        "token_key", DEFAULT_KEY_DESCRIPTION, config_path
+    )
+    return AeadStore(description=description)
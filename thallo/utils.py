@@ -8,23 +8,43 @@ import tempfile
 from datetime import datetime, timedelta
 
 import click
-import dateparser
-import pytimeparse2
 
 
 def today():
     return datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
 
 
-def get_root_dir() -> pathlib.Path:
-    return pathlib.Path.home() / ".thallo"
+def get_root_dir(profile: str = None) -> pathlib.Path:
+    """
+    The directory holding the token, configuration and caches. Each named
+    profile gets a directory of its own.
+    """
+    root_dir = pathlib.Path.home() / ".thallo"
+    if profile:
+        return root_dir / "profiles" / profile
+    return root_dir
 
 
-def get_token_path() -> pathlib.Path:
-    root_dir = get_root_dir()
+def get_token_path(root_dir: pathlib.Path = None) -> pathlib.Path:
+    root_dir = root_dir or get_root_dir()
     return root_dir / "TOKEN"
 
 
+def get_config_path(root_dir: pathlib.Path = None) -> pathlib.Path:
+    root_dir = root_dir or get_root_dir()
+    return root_dir / "thallo.conf"
+
+
+def get_index_path(root_dir: pathlib.Path = None) -> pathlib.Path:
+    root_dir = root_dir or get_root_dir()
+    return root_dir / "index.db"
+
+
+def get_outbox_path(root_dir: pathlib.Path = None) -> pathlib.Path:
+    root_dir = root_dir or get_root_dir()
+    return root_dir / "outbox.db"
+
+
 def tmp_editor(contents="") -> str:
     """Pop an $EDITOR with some optional contents."""
     with tempfile.NamedTemporaryFile(mode="w+") as tmp:
@@ -36,6 +56,10 @@ def tmp_editor(contents="") -> str:
 
 
 def parse_date(s: str) -> datetime:
+    # imported here as it is slow to import, and not needed to complete
+    # commands in the shell
+    import dateparser
+
     return dateparser.parse(
         s,
         settings={"PREFER_DATES_FROM": "future", "DATE_ORDER": "DMY"},
@@ -44,6 +68,8 @@ def parse_date(s: str) -> datetime:
 
 
 def parse_delta(s: str) -> timedelta:
+    import pytimeparse2
+
     return timedelta(seconds=pytimeparse2.parse(s))
 
 
@@ -57,9 +83,21 @@ def parse_start_of_day(dates: list[str]) -> datetime:
     )
 
 
+def get_config_value(
+    key: str, default=None, config_path: pathlib.Path = None, section="general"
+):
+    """Read a setting from a section of the configuration file."""
+    config_path = config_path or get_config_path()
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    if section in config:
+        return config[section].get(key, default)
+    return default
+
+
 @functools.lru_cache()
-def get_gpg_recipient() -> str:
-    config_path = get_root_dir() / "thallo.conf"
+def get_gpg_recipient(config_path: pathlib.Path = None) -> str:
+    config_path = config_path or get_config_path()
     config = configparser.ConfigParser()
     config.read(config_path)
 
@@ -68,11 +106,13 @@ def get_gpg_recipient() -> str:
             return config["general"]["gpg_recipient"]
 
     print(
-        "No gpg_recipient set in the configuration file (`~/.thallo/thallo.conf`). Please provide the GPG ID of the recipient (see the README of thallo if you're unsure what that means"
+        f"No gpg_recipient set in the configuration file (`{config_path}`). Please provide the GPG ID of the recipient (see the README of thallo if you're unsure what that means"
     )
     recipient = input("Recipient:\n")
 
-    config["general"] = {"gpg_recipient": recipient}
+    if "general" not in config:
+        config["general"] = {}
+    config["general"]["gpg_recipient"] = recipient
 
     with config_path.open("w") as f:
         config.write(f)
@@ -0,0 +1,186 @@
+"""
+Watching a calendar for changes. A long-lived session polls the delta of the
+calendar view, so each poll costs in proportion to what changed rather than
+to the size of the calendar.
+"""
+
+import threading
+
+from datetime import datetime, timedelta
+
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+import thallo.utils as utils
+
+from thallo.calendar import Calendar
+
+ADDED = "added"
+UPDATED = "updated"
+REMOVED = "removed"
+
+# statuses that retrying will not fix
+FATAL_STATUSES = {401, 403}
+
+
+def retryable(e: Exception) -> bool:
+    """Whether a failed poll is worth trying again later."""
+    if isinstance(e, (ConnectionError, Timeout)):
+        return True
+    if isinstance(e, HTTPError):
+        return e.response is None or e.response.status_code not in FATAL_STATUSES
+    return False
+
+
+def change_record(change: str, event_id: str, event: dict = None) -> dict:
+    """A JSON-serialisable description of a single change."""
+    record = {"change": change, "id": event_id}
+    if event is not None:
+        record["event"] = dict(
+            event,
+            start_time=event["start_time"].isoformat(),
+            end_time=event["end_time"].isoformat(),
+        )
+    return record
+
+
+class Watcher:
+    """
+    Tracks the events of a calendar view through delta queries, reporting
+    each added, updated or removed event to `callback` as a change record.
+
+    Events are told apart by their `changeKey`, so an event that the server
+    reports again without having changed produces no record. The window is
+    either fixed (`start` and `end`) or rolls forward with the current day
+    (`days`).
+
+    The polling interval adapts to the calendar: it drops to `min_interval`
+    whenever something changed, and otherwise grows by `backoff` on each quiet
+    poll up to `max_interval`.
+    """
+
+    def __init__(
+        self,
+        calendar: Calendar,
+        callback,
+        start: datetime = None,
+        end: datetime = None,
+        days=14,
+        min_interval=15.0,
+        max_interval=600.0,
+        backoff=1.5,
+        initial=True,
+    ):
+        self.calendar = calendar
+        self.callback = callback
+        self.fixed_window = start is not None and end is not None
+        self.start, self.end = start, end
+        self.days = days
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.initial = initial
+
+        self.interval = min_interval
+        self.known = {}
+        self.delta_link = None
+
+    def _window(self) -> tuple[datetime, datetime]:
+        if self.fixed_window:
+            return self.start, self.end
+        today = utils.today()
+        return today, today + timedelta(days=self.days)
+
+    def _convert(self, raw: dict) -> dict:
+        return Calendar.extract_fields(self.calendar.to_event(raw))
+
+    def _apply(self, raws: list[dict]) -> list[dict]:
+        changes = []
+        index = self.calendar.index
+        for raw in raws:
+            event_id = raw["id"]
+            if "@removed" in raw:
+                if self.known.pop(event_id, None) is not None:
+                    changes.append(change_record(REMOVED, event_id))
+                    if index is not None:
+                        index.remove(event_id)
+                continue
+
+            change_key = raw.get("changeKey")
+            previous = self.known.get(event_id)
+            if previous == change_key:
+                continue
+            self.known[event_id] = change_key
+
+            event = self._convert(raw)
+            change = ADDED if previous is None else UPDATED
+            changes.append(change_record(change, event_id, event))
+            if index is not None:
+                index.put(event_id, event)
+        return changes
+
+    def sync(self) -> list[dict]:
+        """
+        Fetch the whole window afresh, reporting the differences from what
+        was known before. Used to start watching, when the window moves, and
+        when the server forgets the delta link.
+        """
+        self.start, self.end = self._window()
+        raws, self.delta_link = self.calendar.delta(self.start, self.end)
+
+        present = {r["id"] for r in raws if "@removed" not in r}
+        gone = [{"id": i, "@removed": {}} for i in self.known if i not in present]
+        return self._apply(gone + raws)
+
+    def poll(self) -> list[dict]:
+        """Fetch and report the changes since the last poll."""
+        if self.delta_link is None or self._window() != (self.start, self.end):
+            return self.sync()
+
+        try:
+            raws, self.delta_link = self.calendar.delta(link=self.delta_link)
+        except HTTPError as e:
+            # an expired delta link needs a full sync
+            if e.response is not None and e.response.status_code == 410:
+                return self.sync()
+            raise
+        return self._apply(raws)
+
+    def next_interval(self, n_changes: int) -> float:
+        """The time to wait before the next poll, given the last poll's changes."""
+        if n_changes > 0:
+            return self.min_interval
+        return min(self.interval * self.backoff, self.max_interval)
+
+    def run(self, stop: threading.Event = None, on_error=None):
+        """
+        Poll until `stop` is set. Connection problems and server errors are
+        passed to `on_error` (if given) and retried at the longest interval;
+        only authorization errors (401 and 403) are raised.
+        """
+        stop = stop or threading.Event()
+        first = True
+        while not stop.is_set():
+            try:
+                changes = self.poll()
+            except (ConnectionError, Timeout, HTTPError) as e:
+                if not retryable(e):
+                    raise
+                if on_error is not None:
+                    on_error(e)
+                self.interval = self.max_interval
+            else:
+                if not first or self.initial:
+                    for change in changes:
+                        self.callback(change)
+                self.interval = self.next_interval(0 if first else len(changes))
+                first = False
+            stop.wait(self.interval)
+
+
+def watch(calendar: Calendar, callback, stop: threading.Event = None, **kwargs):
+    """
+    Call `callback` with a change record for every event added, updated or
+    removed in the calendar, until `stop` is set. See `Watcher` for the
+    options.
+    """
+    Watcher(calendar, callback, **kwargs).run(stop=stop)